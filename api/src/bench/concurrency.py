@@ -0,0 +1,79 @@
+import sys
+import time
+
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+
+import requests
+
+from requests.adapters import HTTPAdapter
+
+################################################################################
+#
+# Concurrency benchmark
+#
+# Fires a fixed number of requests at a running API instance at increasing
+# levels of concurrency. If the handlers block the event loop, throughput stays
+# flat as concurrency rises; if they overlap, it scales until the worker or
+# connection pool is saturated.
+#
+# Usage: python -m bench.concurrency <api host> <endpoint> [requests]
+#
+################################################################################
+
+concurrency_levels = [1, 2, 4, 8, 16, 32]
+default_request_count = 256
+
+
+@dataclass
+class BenchResult:
+    concurrency: int
+    requests: int
+    failures: int
+    seconds: float
+
+    def throughput(self) -> float:
+        return self.requests / self.seconds
+
+
+def run_level(url: str, concurrency: int, request_count: int) -> BenchResult:
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_maxsize=concurrency)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+
+    def fetch(_: int) -> bool:
+        return session.get(url).status_code == 200
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(fetch, range(request_count)))
+    seconds = time.perf_counter() - start
+    session.close()
+    return BenchResult(concurrency, request_count, results.count(False), seconds)
+
+
+def run_bench(host: str, endpoint: str, request_count: int) -> list[BenchResult]:
+    url = f"{host}/{endpoint}"
+    # warm up the pool and any caches so the first level is not penalised
+    run_level(url, 1, 4)
+    results = []
+    for concurrency in concurrency_levels:
+        result = run_level(url, concurrency, request_count)
+        print(
+            f"concurrency {result.concurrency:>3}: "
+            f"{result.throughput():8.1f} req/s "
+            f"({result.failures} failed, {result.seconds:.2f}s)"
+        )
+        results.append(result)
+    return results
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 3:
+        print("Usage: python -m bench.concurrency <api host> <endpoint> [requests]")
+        exit(1)
+    request_count = int(sys.argv[3]) if len(sys.argv) > 3 else default_request_count
+    results = run_bench(sys.argv[1], sys.argv[2], request_count)
+    speedup = results[-1].throughput() / results[0].throughput()
+    print(f"speedup at {results[-1].concurrency}x concurrency: {speedup:.1f}x")
@@ -0,0 +1,96 @@
+import csv
+import random
+import sys
+import tempfile
+import time
+
+from pathlib import Path
+
+from convertbng.util import convert_lonlat  # type: ignore
+
+from pull.bus import east, lat, lon, north, read_naptan
+
+################################################################################
+#
+# NaPTAN conversion benchmark
+#
+# Generates a synthetic NaPTAN file in which a proportion of the stops have no
+# latitude and longitude, then compares converting their eastings and
+# northings one point at a time against the batched conversion used by
+# read_naptan.
+#
+# Usage: python -m bench.naptan [rows] [proportion without coordinates]
+#
+################################################################################
+
+naptan_columns = 43
+default_row_count = 100000
+default_missing_proportion = 0.2
+
+
+def write_synthetic_naptan(path: Path, row_count: int, missing: float):
+    rng = random.Random(0)
+    with open(path, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow([f"Column{i}" for i in range(naptan_columns)])
+        for i in range(row_count):
+            row = [""] * naptan_columns
+            row[0] = f"0{i:011d}"
+            row[4] = f"stop number {i}"
+            row[14] = "Stop A"
+            row[16] = "N"
+            row[18] = "Somewhere"
+            row[east] = str(rng.randint(100000, 600000))
+            row[north] = str(rng.randint(50000, 1000000))
+            if rng.random() >= missing:
+                row[lat] = str(rng.uniform(50, 58))
+                row[lon] = str(rng.uniform(-5, 1))
+            writer.writerow(row)
+
+
+def read_unconverted_points(path: Path) -> list[tuple[float, float]]:
+    with open(path, "r") as f:
+        rows = csv.reader(f)
+        next(rows, None)
+        return [
+            (float(row[east]), float(row[north]))
+            for row in rows
+            if row[lat] == "" or row[lon] == ""
+        ]
+
+
+def time_per_point(points: list[tuple[float, float]]) -> float:
+    start = time.perf_counter()
+    for easting, northing in points:
+        convert_lonlat([easting], [northing])
+    return time.perf_counter() - start
+
+
+def time_batched(points: list[tuple[float, float]]) -> float:
+    eastings = [point[0] for point in points]
+    northings = [point[1] for point in points]
+    start = time.perf_counter()
+    convert_lonlat(eastings, northings)
+    return time.perf_counter() - start
+
+
+def time_read_naptan(path: Path) -> tuple[int, float]:
+    start = time.perf_counter()
+    count = sum(1 for _ in read_naptan(path))
+    return (count, time.perf_counter() - start)
+
+
+if __name__ == "__main__":
+    row_count = int(sys.argv[1]) if len(sys.argv) > 1 else default_row_count
+    missing = float(sys.argv[2]) if len(sys.argv) > 2 else default_missing_proportion
+    with tempfile.TemporaryDirectory() as directory:
+        path = Path(directory) / "naptan.csv"
+        write_synthetic_naptan(path, row_count, missing)
+        points = read_unconverted_points(path)
+        print(f"{row_count} rows, {len(points)} without coordinates")
+        per_point = time_per_point(points)
+        batched = time_batched(points)
+        print(f"per point: {per_point:.3f}s")
+        print(f"batched:   {batched:.3f}s ({per_point / batched:.1f}x faster)")
+        (count, seconds) = time_read_naptan(path)
+        print(f"read_naptan: {count} stops in {seconds:.3f}s")
@@ -0,0 +1,98 @@
+import random
+import statistics
+import sys
+import time
+
+import requests
+
+################################################################################
+#
+# Search benchmark
+#
+# Sends a mix of whole, partial and misspelt place names to the search endpoint
+# of a running API instance one at a time and reports latency percentiles,
+# along with how many bus stops the instance has loaded. The numbers are only
+# meaningful with the full NaPTAN set, which is several hundred thousand stops.
+#
+# Usage: python -m bench.search <api host> [requests]
+#
+################################################################################
+
+default_request_count = 500
+# well under the size of the full NaPTAN set, so anything smaller is a partial
+# or test load
+full_naptan_stops = 300000
+
+place_names = [
+    "birmingham new street",
+    "manchester piccadilly",
+    "edinburgh waverley",
+    "selly oak",
+    "university",
+    "kings cross",
+    "bull ring",
+    "high street",
+    "church road",
+    "bus station",
+    "hospital",
+    "market square",
+    "railway station",
+    "town hall",
+    "park lane",
+]
+
+
+def misspell(name: str, rng: random.Random) -> str:
+    i = rng.randrange(len(name))
+    operation = rng.choice(["drop", "swap", "double"])
+    if operation == "drop":
+        return name[:i] + name[i + 1 :]
+    if operation == "swap" and i < len(name) - 1:
+        return name[:i] + name[i + 1] + name[i] + name[i + 2 :]
+    return name[:i] + name[i] + name[i:]
+
+
+def make_queries(count: int) -> list[str]:
+    rng = random.Random(0)
+    queries = []
+    for _ in range(count):
+        name = rng.choice(place_names)
+        kind = rng.choice(["whole", "prefix", "misspelt"])
+        if kind == "prefix":
+            name = name[: rng.randint(3, len(name))]
+        elif kind == "misspelt":
+            name = misspell(name, rng)
+        queries.append(name)
+    return queries
+
+
+def percentile(timings: list[float], p: float) -> float:
+    ordered = sorted(timings)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * p))]
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print("Usage: python -m bench.search <api host> [requests]")
+        exit(1)
+    host = sys.argv[1]
+    count = int(sys.argv[2]) if len(sys.argv) > 2 else default_request_count
+    session = requests.Session()
+    stats = session.get(f"{host}/stats")
+    stats.raise_for_status()
+    stops = stats.json()["reference_index"]["bus_stops"]
+    print(f"{stops} bus stops loaded")
+    if stops < full_naptan_stops:
+        print("Warning: the full NaPTAN set does not seem to be loaded")
+    timings = []
+    failures = 0
+    for query in make_queries(count):
+        start = time.perf_counter()
+        response = session.get(f"{host}/search", params={"q": query})
+        timings.append((time.perf_counter() - start) * 1000)
+        if response.status_code != 200:
+            failures = failures + 1
+    print(f"{count} queries, {failures} failed")
+    print(f"mean {statistics.mean(timings):.1f}ms")
+    print(f"p50  {percentile(timings, 0.5):.1f}ms")
+    print(f"p99  {percentile(timings, 0.99):.1f}ms")
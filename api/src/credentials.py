@@ -11,6 +11,7 @@ class Credentials:
 rtt = "RTT"
 natrail = "NATRAIL"
 netrail = "NETRAIL"
+admin = "ADMIN"
 
 
 def get_api_credentials(prefix: str) -> Credentials:
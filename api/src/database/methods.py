@@ -1,15 +1,31 @@
+import functools
+import io
+import time
+
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from itertools import islice
+from threading import Lock
+from typing import Callable, Iterable, Iterator, Optional, Sequence, TypeVar
+
 from dotenv import dotenv_values
 from psycopg2 import connect as db_connect
 
+from metrics import query_duration
 
-def connect() -> tuple:
+
+def get_connection_params() -> dict:
     env = dotenv_values(".env")
-    conn = db_connect(
-        dbname=env["DB_NAME"],
-        user=env["DB_USER"],
-        password=env["DB_PASSWD"],
-        host=env["DB_HOST"],
-    )
+    return {
+        "dbname": env["DB_NAME"],
+        "user": env["DB_USER"],
+        "password": env["DB_PASSWD"],
+        "host": env["DB_HOST"],
+    }
+
+
+def connect() -> tuple:
+    conn = db_connect(**get_connection_params())
     cur = conn.cursor()
     return (conn, cur)
 
@@ -19,48 +35,116 @@ def disconnect(conn, cur):
     cur.close()
 
 
-def create(cur, name: str, fields: list[str]):
-    all_fields = ", ".join(fields)
-    statement = f"CREATE TABLE {name} ({all_fields})"
-    cur.execute(statement)
+# Counts the queries made while handling a single request, so that we can check
+# how many round trips each endpoint costs. The counter is shared with every
+# executor thread the request hands work to, so it is only changed under its
+# lock
+@dataclass
+class QueryCounter:
+    count: int = 0
+    lock: Lock = field(default_factory=Lock)
+
+
+query_counter: ContextVar[Optional[QueryCounter]] = ContextVar(
+    "query_counter", default=None
+)
+
+
+def count_query():
+    counter = query_counter.get()
+    if counter is not None:
+        with counter.lock:
+            counter.count = counter.count + 1
+
+
+# The name that the queries being made are timed under, which is the name of
+# the innermost function marked as a named query
+query_name: ContextVar[str] = ContextVar("query_name", default="unnamed")
+
+F = TypeVar("F", bound=Callable)
+
+
+def named_query(fn: F) -> F:
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        token = query_name.set(fn.__name__)
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            query_name.reset(token)
+
+    return wrapper  # type: ignore
+
+
+def execute(cur, statement: str, params: dict = {}):
+    count_query()
+    start = time.perf_counter()
+    try:
+        cur.execute(statement, params)
+    finally:
+        query_duration.observe(time.perf_counter() - start, query_name.get())
+
+
+CopyValue = Optional[str | float]
+
+
+def escape_copy_value(x: CopyValue) -> str:
+    if x is None:
+        return "\\N"
+    if not isinstance(x, str):
+        return str(x)
+    return (
+        x.replace("\u2019", "'")
+        .replace("\\", "\\\\")
+        .replace("\t", "\\t")
+        .replace("\n", "\\n")
+        .replace("\r", "\\r")
+    )
 
 
-def str_or_none_to_str(x: str | None) -> str:
-    if x is None or x == "":
-        return "''"
-    else:
-        replaced = x.replace("\u2019", "'")
-        return f"$${replaced}$$"
+def make_copy_line(values: Sequence[CopyValue]) -> str:
+    return "\t".join(map(escape_copy_value, values)) + "\n"
 
 
-def list_of_str_and_none_to_postgres_str(values: list[str | None]) -> list[str]:
-    return list(map(str_or_none_to_str, values))
+def batches(values: Iterable[Sequence[CopyValue]], size: int) -> Iterator[list]:
+    iterator = iter(values)
+    while True:
+        batch = list(islice(iterator, size))
+        if len(batch) == 0:
+            return
+        yield batch
 
 
-def insert(cur, table: str, fields: list[str], values: list[list[str | None]]):
-    partition_length = 500
-    partitions = [
-        values[i * partition_length : (i + 1) * partition_length]
-        for i in range((len(values) + partition_length - 1) // partition_length)
-    ]
+def copy(
+    cur,
+    table: str,
+    fields: list[str],
+    values: Iterable[Sequence[CopyValue]],
+    batch_size: int = 50000,
+) -> int:
     rows = ",".join(fields)
-    for partition in partitions:
-        value_strings = list(
-            map(
-                lambda x: f"({','.join(list_of_str_and_none_to_postgres_str(x))})",
-                partition,
-            )
-        )
-        statement = f"""
-            INSERT into {table}({rows})
-            VALUES {",".join(value_strings)}
-        """
-        print(statement)
-        cur.execute(statement)
+    statement = f"COPY {table}({rows}) FROM STDIN"
+    total = 0
+    start = time.perf_counter()
+    for batch in batches(values, batch_size):
+        buffer = io.StringIO("".join(map(make_copy_line, batch)))
+        count_query()
+        batch_start = time.perf_counter()
+        cur.copy_expert(statement, buffer)
+        query_duration.observe(time.perf_counter() - batch_start, query_name.get())
+        total = total + len(batch)
+    seconds = time.perf_counter() - start
+    rate = total / seconds if seconds > 0 else 0
+    print(f"Copied {total} rows into {table} in {seconds:.2f}s ({rate:.0f} rows/s)")
+    return total
+
+
+def escape_like(x: str) -> str:
+    return x.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
 
 
 def select_query(cur, query: str, params: dict = {}) -> list:
-    cur.execute(query, params)
+    execute(cur, query, params)
     rows = cur.fetchall()
     return rows
 
@@ -74,6 +158,6 @@ def select(
         where_list = " AND ".join(where)
         statement = f"{statement} WHERE {where_list}"
     print(statement)
-    cur.execute(statement, params)
+    execute(cur, statement, params)
     rows = cur.fetchall()
     return rows
@@ -0,0 +1,345 @@
+from dataclasses import dataclass
+
+from database.methods import connect, disconnect, execute, select
+from database.schema import *
+
+################################################################################
+#
+# Migrations
+#
+# The schema is built up by an ordered list of migrations. Each one is applied
+# in its own transaction and recorded in the schema version table, so running
+# the migrations again only applies those that are new.
+#
+################################################################################
+
+
+@dataclass
+class Migration:
+    version: int
+    name: str
+    statements: list[str]
+
+
+def create_table(name: str, fields: list[str]) -> str:
+    all_fields = ", ".join(fields)
+    # tables may already exist in databases created before migrations
+    return f"CREATE TABLE IF NOT EXISTS {name} ({all_fields})"
+
+
+def create_index(
+    name: str,
+    table: str,
+    columns: list[str],
+    unique: bool = False,
+    method: str = "BTREE",
+) -> str:
+    all_columns = ", ".join(columns)
+    index_type = "UNIQUE INDEX" if unique else "INDEX"
+    return f"""
+        CREATE {index_type} IF NOT EXISTS {name}
+        ON {table} USING {method} ({all_columns})
+    """
+
+
+def create_trigram_index(
+    name: str, table: str, expression: str, method: str = "GIN"
+) -> str:
+    return f"""
+        CREATE INDEX IF NOT EXISTS {name}
+        ON {table} USING {method} (({expression}) {method.lower()}_trgm_ops)
+    """
+
+
+# every distinct word in the text searched for bus stops
+insert_bus_stop_words = f"""
+    INSERT INTO {bus_stop_word_table} (word)
+    SELECT DISTINCT word
+    FROM {bus_stop_table}, unnest(tsvector_to_array({bus_stop_search_words})) AS word
+"""
+
+
+# Colour was created by create_all as (name, type, foreground, background),
+# which is moved to the (type, code, fg, bg) columns the queries read
+adopt_create_all_colours = f"""
+    DO $$
+    BEGIN
+        IF EXISTS (
+            SELECT FROM information_schema.columns
+            WHERE table_schema = current_schema()
+            AND table_name = lower('{colour_table}')
+            AND column_name = 'foreground'
+        ) THEN
+            ALTER TABLE {colour_table}
+                ADD COLUMN IF NOT EXISTS code TEXT,
+                ADD COLUMN IF NOT EXISTS fg TEXT,
+                ADD COLUMN IF NOT EXISTS bg TEXT;
+            UPDATE {colour_table}
+            SET code = name, fg = foreground, bg = background;
+            ALTER TABLE {colour_table}
+                DROP COLUMN name,
+                DROP COLUMN foreground,
+                DROP COLUMN background,
+                ALTER COLUMN code SET NOT NULL;
+        END IF;
+    END
+    $$
+"""
+
+
+# Train_Station had no key before migrations, so a station can appear more than
+# once; the first copy of each is kept
+delete_duplicate_train_stations = f"""
+    DELETE FROM {train_station_table} AS duplicate
+    USING {train_station_table} AS kept
+    WHERE duplicate.crs = kept.crs
+    AND duplicate.ctid > kept.ctid
+"""
+
+
+migrations = [
+    Migration(
+        1,
+        "create tables",
+        [
+            create_table(
+                bus_stop_table,
+                [
+                    "atco TEXT NOT NULL PRIMARY KEY",
+                    "naptan TEXT",
+                    "name TEXT NOT NULL",
+                    "parent_locality TEXT",
+                    "locality TEXT NOT NULL",
+                    "landmark TEXT",
+                    "street TEXT",
+                    "indicator TEXT",
+                    "bearing TEXT NOT NULL",
+                    "lat FLOAT NOT NULL",
+                    "lon FLOAT NOT NULL",
+                ],
+            ),
+            create_table(
+                train_station_table,
+                [
+                    "crs TEXT NOT NULL",
+                    "name TEXT NOT NULL",
+                    "lat FLOAT NOT NULL",
+                    "lon FLOAT NOT NULL",
+                    "operator TEXT NOT NULL",
+                ],
+            ),
+            create_table(
+                toc_table,
+                ["name TEXT NOT NULL", "atoc TEXT NOT NULL PRIMARY KEY"],
+            ),
+            create_table(
+                colour_table,
+                [
+                    "type TEXT NOT NULL",
+                    "code TEXT NOT NULL",
+                    "fg TEXT",
+                    "bg TEXT",
+                ],
+            ),
+            create_table(
+                brand_table,
+                [
+                    "parent TEXT NOT NULL",
+                    "atoc TEXT NOT NULL PRIMARY KEY",
+                    "endpoints TEXT[]",
+                ],
+            ),
+            create_table(
+                rtt_service_table,
+                [
+                    "service_id TEXT NOT NULL",
+                    "run_date DATE NOT NULL",
+                    "response JSONB NOT NULL",
+                    "fetched TIMESTAMP WITH TIME ZONE NOT NULL",
+                    "PRIMARY KEY (service_id, run_date)",
+                ],
+            ),
+        ],
+    ),
+    Migration(
+        2,
+        "index reference data",
+        [
+            delete_duplicate_train_stations,
+            f"ALTER TABLE {train_station_table} ADD PRIMARY KEY (crs)",
+            create_index("train_station_name_idx", train_station_table, ["name"]),
+            create_index(
+                "train_station_lower_name_idx", train_station_table, ["lower(name)"]
+            ),
+            create_index(
+                "train_station_operator_idx", train_station_table, ["operator"]
+            ),
+            create_index("toc_name_idx", toc_table, ["name"]),
+            adopt_create_all_colours,
+            create_index(
+                "colour_type_code_key", colour_table, ["type", "code"], unique=True
+            ),
+            create_index("colour_code_idx", colour_table, ["code"]),
+            create_index("brand_parent_idx", brand_table, ["parent"]),
+        ],
+    ),
+    Migration(
+        3,
+        "index names for search",
+        [
+            "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+            create_trigram_index(
+                "bus_stop_search_idx", bus_stop_table, bus_stop_search_text
+            ),
+            create_trigram_index(
+                "train_station_search_idx",
+                train_station_table,
+                train_station_search_text,
+            ),
+        ],
+    ),
+    Migration(
+        4,
+        "hash bus stop contents",
+        [f"ALTER TABLE {bus_stop_table} ADD COLUMN IF NOT EXISTS content_hash TEXT"],
+    ),
+    Migration(
+        5,
+        "create network tables",
+        [
+            create_table(
+                corpus_location_table,
+                [
+                    "tiploc TEXT",
+                    "stanox TEXT",
+                    "crs TEXT",
+                    "nlc TEXT",
+                    "uic TEXT",
+                    "name TEXT",
+                    "short_name TEXT",
+                ],
+            ),
+            create_index(
+                "corpus_location_tiploc_idx", corpus_location_table, ["tiploc"]
+            ),
+            create_index("corpus_location_crs_idx", corpus_location_table, ["crs"]),
+            create_table(
+                timing_point_table,
+                [
+                    "tiploc TEXT NOT NULL",
+                    "name TEXT NOT NULL",
+                    "easting INTEGER",
+                    "northing INTEGER",
+                    "stanox TEXT",
+                ],
+            ),
+            create_index("timing_point_tiploc_idx", timing_point_table, ["tiploc"]),
+            create_table(
+                network_link_table,
+                [
+                    "origin TEXT NOT NULL",
+                    "destination TEXT NOT NULL",
+                    "line TEXT",
+                    "distance INTEGER",
+                ],
+            ),
+            create_index("network_link_origin_idx", network_link_table, ["origin"]),
+        ],
+    ),
+    Migration(
+        6,
+        "index bus stop words for search",
+        [
+            # a prefix of the whole text can be found in order in a C collated
+            # index, whatever the collation of the database
+            create_index(
+                "bus_stop_prefix_idx",
+                bus_stop_table,
+                [f'{bus_stop_search_text} COLLATE "C"'],
+            ),
+            create_index(
+                "bus_stop_words_idx",
+                bus_stop_table,
+                [bus_stop_search_words],
+                method="GIN",
+            ),
+            create_table(bus_stop_word_table, ["word TEXT NOT NULL PRIMARY KEY"]),
+            insert_bus_stop_words,
+            create_trigram_index(
+                "bus_stop_word_similarity_idx",
+                bus_stop_word_table,
+                "word",
+                method="GIST",
+            ),
+            # misspellings are matched against the words instead
+            "DROP INDEX IF EXISTS bus_stop_search_idx",
+        ],
+    ),
+]
+
+# arbitrary key for the advisory lock held while migrating, so that two
+# processes starting at once do not both apply the same migration
+migration_lock_key = 7232001
+
+
+def create_schema_version_table(cur):
+    fields = [
+        "version INTEGER NOT NULL PRIMARY KEY",
+        "name TEXT NOT NULL",
+        "applied TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT now()",
+    ]
+    execute(cur, create_table(schema_version_table, fields))
+
+
+def select_applied_versions(cur) -> set[int]:
+    rows = select(cur, ["version"], schema_version_table)
+    return set(map(lambda row: row[0], rows))
+
+
+def select_schema_version(cur) -> int:
+    rows = select(cur, ["COALESCE(MAX(version), 0)"], schema_version_table)
+    return rows[0][0]
+
+
+def apply_migration(cur, migration: Migration):
+    print(f"Applying migration {migration.version}: {migration.name}")
+    for statement in migration.statements:
+        execute(cur, statement)
+    statement = f"""
+        INSERT INTO {schema_version_table} (version, name)
+        VALUES (%(version)s, %(name)s)
+    """
+    execute(cur, statement, {"version": migration.version, "name": migration.name})
+
+
+def migrate(conn, cur) -> int:
+    create_schema_version_table(cur)
+    conn.commit()
+    execute(cur, "SELECT pg_advisory_lock(%(key)s)", {"key": migration_lock_key})
+    try:
+        applied = select_applied_versions(cur)
+        for migration in migrations:
+            if migration.version in applied:
+                continue
+            try:
+                apply_migration(cur, migration)
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+        version = select_schema_version(cur)
+    finally:
+        execute(cur, "SELECT pg_advisory_unlock(%(key)s)", {"key": migration_lock_key})
+        conn.commit()
+    print(f"Schema is at version {version}")
+    return version
+
+
+def migrate_all():
+    (conn, cur) = connect()
+    migrate(conn, cur)
+    disconnect(conn, cur)
+
+
+if __name__ == "__main__":
+    migrate_all()
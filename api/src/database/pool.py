@@ -0,0 +1,230 @@
+from contextlib import contextmanager
+from dataclasses import dataclass
+import time
+
+from threading import BoundedSemaphore, Lock
+from typing import Callable, Iterator, Optional, TypeVar
+
+from dotenv import dotenv_values
+from psycopg2 import InterfaceError, OperationalError
+from psycopg2.extensions import TRANSACTION_STATUS_IDLE, TRANSACTION_STATUS_UNKNOWN
+from psycopg2.pool import ThreadedConnectionPool
+
+from database.methods import get_connection_params
+
+################################################################################
+#
+# Connection pool
+#
+# The API keeps a pool of open connections for the lifetime of the process
+# rather than opening a fresh connection for every request. Connections are
+# checked out for the duration of a single request and returned afterwards,
+# except by requests that wait on upstream services, which check one out only
+# for each query they make.
+#
+################################################################################
+
+
+@dataclass
+class PoolConfig:
+    min_size: int
+    max_size: int
+    # seconds a connection can sit idle before it is pinged on checkout
+    ping_after: float
+
+
+default_pool_min_size = 1
+default_pool_max_size = 10
+default_pool_ping_after = 30
+
+
+def get_pool_config() -> PoolConfig:
+    env = dotenv_values(".env")
+    min_size = int(env.get("DB_POOL_MIN") or default_pool_min_size)
+    max_size = int(env.get("DB_POOL_MAX") or default_pool_max_size)
+    ping_after = float(env.get("DB_POOL_PING_AFTER") or default_pool_ping_after)
+    if min_size < 0 or max_size < 1 or min_size > max_size:
+        raise RuntimeError(f"Invalid pool size {min_size}..{max_size}")
+    return PoolConfig(min_size, max_size, ping_after)
+
+
+@dataclass
+class Pool:
+    config: PoolConfig
+    connections: ThreadedConnectionPool
+    # getconn raises rather than blocks when the pool is exhausted, so
+    # checkouts wait on this first
+    available: BoundedSemaphore
+    lock: Lock
+    # when each idle connection was returned to the pool, keyed by its id
+    returned: dict[int, float]
+    # the pool opens min_size connections up front and keeps at most that many
+    # idle, closing any others as they are returned
+    idle: int
+    in_use: int = 0
+    waiting: int = 0
+    checkouts: int = 0
+    discarded: int = 0
+
+
+pool: Optional[Pool] = None
+
+
+def open_pool(config: Optional[PoolConfig] = None):
+    global pool
+    if pool is not None:
+        return
+    if config is None:
+        config = get_pool_config()
+    connections = ThreadedConnectionPool(
+        config.min_size, config.max_size, **get_connection_params()
+    )
+    pool = Pool(
+        config,
+        connections,
+        BoundedSemaphore(config.max_size),
+        Lock(),
+        {},
+        config.min_size,
+    )
+
+
+def close_pool():
+    global pool
+    if pool is None:
+        return
+    pool.connections.closeall()
+    pool = None
+
+
+def get_pool() -> Pool:
+    if pool is None:
+        raise RuntimeError("Connection pool has not been opened")
+    return pool
+
+
+def is_healthy(conn) -> bool:
+    return conn.closed == 0 and conn.get_transaction_status() == TRANSACTION_STATUS_IDLE
+
+
+# psycopg2 only notices that the server has dropped a connection when a
+# statement on it fails, so connections that have been idle for a while are
+# checked with a trivial query before they are handed out
+def is_alive(conn) -> bool:
+    try:
+        with conn.cursor() as cur:
+            cur.execute("SELECT 1")
+        conn.rollback()
+        return True
+    except (OperationalError, InterfaceError):
+        return False
+
+
+def take_connection(current: Pool):
+    conn = current.connections.getconn()
+    with current.lock:
+        current.idle = max(current.idle - 1, 0)
+        # connections opened by the pool have no return time, so are pinged
+        returned = current.returned.pop(id(conn), 0.0)
+    return (conn, time.monotonic() - returned)
+
+
+def discard_connection(current: Pool, conn):
+    with current.lock:
+        current.discarded = current.discarded + 1
+    current.connections.putconn(conn, close=True)
+
+
+def return_connection(current: Pool, conn):
+    close = (
+        conn.closed != 0 or conn.get_transaction_status() == TRANSACTION_STATUS_UNKNOWN
+    )
+    with current.lock:
+        if not close and current.idle < current.config.min_size:
+            current.idle = current.idle + 1
+            current.returned[id(conn)] = time.monotonic()
+    current.connections.putconn(conn, close=close)
+
+
+def get_healthy_connection(current: Pool):
+    # once the idle connections have all been tried the pool opens a new one
+    for _ in range(current.config.min_size):
+        (conn, idle_time) = take_connection(current)
+        if is_healthy(conn) and (
+            idle_time < current.config.ping_after or is_alive(conn)
+        ):
+            return conn
+        # The server may have dropped the connection while it sat idle, or a
+        # previous request left it mid-transaction; replace it with a fresh one
+        discard_connection(current, conn)
+    (conn, _) = take_connection(current)
+    return conn
+
+
+@contextmanager
+def checkout() -> Iterator[tuple]:
+    current = get_pool()
+    with current.lock:
+        current.waiting = current.waiting + 1
+    current.available.acquire()
+    with current.lock:
+        current.waiting = current.waiting - 1
+        current.in_use = current.in_use + 1
+        current.checkouts = current.checkouts + 1
+    conn = None
+    try:
+        conn = get_healthy_connection(current)
+        cur = conn.cursor()
+        try:
+            yield (conn, cur)
+            conn.commit()
+        except Exception:
+            if conn.closed == 0:
+                conn.rollback()
+            raise
+        finally:
+            cur.close()
+    finally:
+        if conn is not None:
+            return_connection(current, conn)
+        with current.lock:
+            current.in_use = current.in_use - 1
+        current.available.release()
+
+
+def get_cursor() -> Iterator:
+    with checkout() as (conn, cur):
+        yield cur
+
+
+T = TypeVar("T")
+
+
+def run_with_cursor(fn: Callable[..., T], *args) -> T:
+    with checkout() as (conn, cur):
+        return fn(cur, *args)
+
+
+@dataclass
+class PoolStats:
+    min_size: int
+    max_size: int
+    in_use: int
+    idle: int
+    waiting: int
+    checkouts: int
+    discarded: int
+
+
+def get_pool_stats() -> PoolStats:
+    current = get_pool()
+    with current.lock:
+        return PoolStats(
+            current.config.min_size,
+            current.config.max_size,
+            current.in_use,
+            current.idle,
+            current.waiting,
+            current.checkouts,
+            current.discarded,
+        )
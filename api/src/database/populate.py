@@ -1,72 +1,225 @@
+import hashlib
+
+from dataclasses import dataclass
+from typing import Iterable, Iterator
+
 from credentials import get_api_credentials
 
-from database.methods import connect, disconnect, insert
+from database.methods import CopyValue, connect, copy, disconnect, execute
+from database.migrate import insert_bus_stop_words
 from database.schema import *
 
 from pull.bus import BusStop, download_naptan, read_naptan
-from pull.train import generate_natrail_token
+from pull.train import (
+    download_bplan,
+    download_corpus,
+    generate_natrail_token,
+    read_bplan_network_links,
+    read_bplan_timing_points,
+    read_corpus,
+)
+from structs.network import CorpusLocation, NetworkLink, TimingPoint
 from structs.train import Toc, TrainStation, pull_stations, pull_tocs
 
 
-def populate_bus_stop_table(cur, conn, stops: list[BusStop]):
-    fields = [
-        "atco",
-        "naptan",
-        "name",
-        "parent_locality",
-        "locality",
-        "landmark",
-        "street",
-        "indicator",
-        "bearing",
-        "lat",
-        "lon",
+# rows sent to the database per COPY, which bounds how much of the file is held
+# in memory at once
+bus_stop_batch_size = 10000
+
+
+bus_stop_fields = [
+    "atco",
+    "naptan",
+    "name",
+    "parent_locality",
+    "locality",
+    "landmark",
+    "street",
+    "indicator",
+    "bearing",
+    "lat",
+    "lon",
+    "content_hash",
+]
+
+
+def hash_bus_stop_values(values: list[CopyValue]) -> str:
+    content = "\x1f".join(map(lambda x: "" if x is None else str(x), values))
+    return hashlib.md5(content.encode()).hexdigest()
+
+
+def get_bus_stop_values(x: BusStop) -> list[CopyValue]:
+    values: list[CopyValue] = [
+        x.atco,
+        x.naptan,
+        x.name,
+        x.parent,
+        x.locality,
+        x.landmark,
+        x.street,
+        x.indicator,
+        x.bearing,
+        x.lat,
+        x.lon,
     ]
-    values: list[list[str | None]] = list(
-        map(
-            lambda x: [
-                x.atco,
-                x.naptan,
-                x.name,
-                x.parent,
-                x.locality,
-                x.landmark,
-                x.street,
-                x.indicator,
-                x.bearing,
-                str(x.lat),
-                str(x.lon),
-            ],
-            stops,
+    return values + [hash_bus_stop_values(values)]
+
+
+@dataclass
+class BusStopRefresh:
+    added: int = 0
+    changed: int = 0
+    removed: int = 0
+    unchanged: int = 0
+
+
+# Every stop in the file is copied into a staging table along with the hash of
+# its contents, and compared with the stored stops in the database, so memory
+# use does not grow with the size of the file. Only stops whose hash differs
+# are written.
+def refresh_bus_stop_table(cur, conn, stops: Iterable[BusStop]) -> BusStopRefresh:
+    staging_table = f"{bus_stop_table}_Staging"
+    # the position keeps the order of the file, as the primary key is not copied
+    execute(
+        cur,
+        f"""
+        CREATE TEMPORARY TABLE {staging_table}
+        (LIKE {bus_stop_table} INCLUDING DEFAULTS, position BIGSERIAL)
+        ON COMMIT DROP
+        """,
+    )
+    values = map(get_bus_stop_values, stops)
+    total = copy(
+        cur, staging_table, bus_stop_fields, values, batch_size=bus_stop_batch_size
+    )
+    # naptan occasionally lists the same stop twice, keep the first
+    execute(
+        cur,
+        f"""
+        DELETE FROM {staging_table}
+        WHERE position NOT IN (
+            SELECT DISTINCT ON (atco) position
+            FROM {staging_table}
+            ORDER BY atco, position
+        )
+        """,
+    )
+    total = total - cur.rowcount
+    # temporary tables are never analysed automatically, and the joins below
+    # need the planner to know how big it is
+    execute(cur, f"ANALYZE {staging_table}")
+    refresh = BusStopRefresh()
+    updates = ", ".join(
+        map(lambda field: f"{field} = staged.{field}", bus_stop_fields[1:])
+    )
+    execute(
+        cur,
+        f"""
+        UPDATE {bus_stop_table} AS stored
+        SET {updates}
+        FROM {staging_table} AS staged
+        WHERE
+            stored.atco = staged.atco
+            AND
+            stored.content_hash IS DISTINCT FROM staged.content_hash
+        """,
+    )
+    refresh.changed = cur.rowcount
+    field_list = ", ".join(bus_stop_fields)
+    execute(
+        cur,
+        f"""
+        INSERT INTO {bus_stop_table} ({field_list})
+        SELECT {field_list} FROM {staging_table} AS staged
+        WHERE NOT EXISTS (
+            SELECT 1 FROM {bus_stop_table} AS stored
+            WHERE stored.atco = staged.atco
+        )
+        """,
+    )
+    refresh.added = cur.rowcount
+    execute(
+        cur,
+        f"""
+        DELETE FROM {bus_stop_table} AS stored
+        WHERE NOT EXISTS (
+            SELECT 1 FROM {staging_table} AS staged
+            WHERE staged.atco = stored.atco
         )
+        """,
     )
-    insert(cur, bus_stop_table, fields, values)
+    refresh.removed = cur.rowcount
+    refresh.unchanged = total - refresh.added - refresh.changed
+    # the words that name search corrects misspellings against
+    if refresh.added + refresh.changed + refresh.removed > 0:
+        execute(cur, f"DELETE FROM {bus_stop_word_table}")
+        execute(cur, insert_bus_stop_words)
     conn.commit()
+    print(
+        f"Bus stops: {refresh.added} added, {refresh.changed} changed, "
+        f"{refresh.removed} removed, {refresh.unchanged} unchanged"
+    )
+    return refresh
 
 
-def populate_train_station_table(cur, conn, stations: list[TrainStation]):
+def populate_train_station_table(cur, conn, stations: Iterable[TrainStation]):
     fields = ["crs", "name", "lat", "lon", "operator"]
-    values: list[list[str | None]] = list(
-        map(
-            lambda x: [x.crs, x.name, str(x.lat), str(x.lon), x.operator],
-            stations,
-        )
+    values: Iterator[list[CopyValue]] = map(
+        lambda x: [x.crs, x.name, x.lat, x.lon, x.operator], stations
     )
-    insert(cur, train_station_table, fields, values)
+    copy(cur, train_station_table, fields, values)
     conn.commit()
 
 
-def populate_toc_table(cur, conn, tocs: list[Toc]):
+def populate_toc_table(cur, conn, tocs: Iterable[Toc]):
     fields = ["name", "atoc"]
-    values: list[list[str | None]] = list(map(lambda x: [x.name, x.atoc], tocs))
-    insert(cur, toc_table, fields, values)
+    values: Iterator[list[CopyValue]] = map(lambda x: [x.name, x.atoc], tocs)
+    copy(cur, toc_table, fields, values)
+    conn.commit()
+
+
+# the network feeds are read straight out of their gzip files and replaced
+# wholesale, so these only ever hold one batch of rows in memory
+network_batch_size = 10000
+
+
+def populate_corpus_location_table(cur, conn, locations: Iterable[CorpusLocation]):
+    fields = ["tiploc", "stanox", "crs", "nlc", "uic", "name", "short_name"]
+    values: Iterator[list[CopyValue]] = map(
+        lambda x: [x.tiploc, x.stanox, x.crs, x.nlc, x.uic, x.name, x.short_name],
+        locations,
+    )
+    execute(cur, f"DELETE FROM {corpus_location_table}")
+    copy(cur, corpus_location_table, fields, values, batch_size=network_batch_size)
+    conn.commit()
+
+
+def populate_timing_point_table(cur, conn, points: Iterable[TimingPoint]):
+    fields = ["tiploc", "name", "easting", "northing", "stanox"]
+    values: Iterator[list[CopyValue]] = map(
+        lambda x: [x.tiploc, x.name, x.easting, x.northing, x.stanox], points
+    )
+    execute(cur, f"DELETE FROM {timing_point_table}")
+    copy(cur, timing_point_table, fields, values, batch_size=network_batch_size)
+    conn.commit()
+
+
+def populate_network_link_table(cur, conn, links: Iterable[NetworkLink]):
+    fields = ["origin", "destination", "line", "distance"]
+    values: Iterator[list[CopyValue]] = map(
+        lambda x: [x.origin, x.destination, x.line, x.distance], links
+    )
+    execute(cur, f"DELETE FROM {network_link_table}")
+    copy(cur, network_link_table, fields, values, batch_size=network_batch_size)
     conn.commit()
 
 
 def populate_bus_stops(cur, conn):
     download_naptan()
     stops = read_naptan()
-    populate_bus_stop_table(cur, conn, stops)
+    # refreshing an empty table adds every stop, so this works for the first
+    # load as well as for later releases
+    refresh_bus_stop_table(cur, conn, stops)
 
 
 def populate_train_stations(cur, conn):
@@ -83,8 +236,24 @@ def populate_tocs(cur, conn):
     populate_toc_table(cur, conn, tocs)
 
 
+def populate_corpus(cur, conn):
+    netrail_credentials = get_api_credentials("NETRAIL")
+    download_corpus(netrail_credentials)
+    populate_corpus_location_table(cur, conn, read_corpus())
+
+
+def populate_bplan(cur, conn):
+    download_bplan()
+    # one pass over the file for each table, as only one COPY can be in
+    # progress on a connection at a time
+    populate_timing_point_table(cur, conn, read_bplan_timing_points())
+    populate_network_link_table(cur, conn, read_bplan_network_links())
+
+
 def populate_all():
     (conn, cur) = connect()
     populate_bus_stops(cur, conn)
     populate_train_stations(cur, conn)
+    populate_corpus(cur, conn)
+    populate_bplan(cur, conn)
     disconnect(conn, cur)
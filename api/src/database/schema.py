@@ -3,3 +3,16 @@ train_station_table = "Train_Station"
 toc_table = "Toc"
 brand_table = "Brand"
 colour_table = "Colour"
+rtt_service_table = "Rtt_Service"
+corpus_location_table = "Corpus_Location"
+timing_point_table = "Timing_Point"
+network_link_table = "Network_Link"
+schema_version_table = "Schema_Version"
+bus_stop_word_table = "Bus_Stop_Word"
+
+# expressions searched by name search, which must match the indexes
+bus_stop_search_text = (
+    "lower(name || ' ' || locality || ' ' || coalesce(indicator, ''))"
+)
+bus_stop_search_words = f"to_tsvector('simple', {bus_stop_search_text})"
+train_station_search_text = "lower(name || ' ' || crs)"
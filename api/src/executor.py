@@ -0,0 +1,103 @@
+import asyncio
+import contextvars
+import functools
+
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Optional, TypeVar
+
+from database.pool import run_with_cursor
+
+################################################################################
+#
+# Blocking executors
+#
+# psycopg2 and requests both block the calling thread, so the async handlers
+# hand that work to bounded pools of worker threads instead of running it on
+# the event loop.
+#
+# Work that needs its own connection waits for one on a separate pool of
+# workers. If it shared workers with handlers that already hold a connection,
+# it could fill every worker while waiting for connections whose work was
+# queued behind it, and nothing would ever finish.
+#
+# Work that fetches from upstream services can spend seconds waiting on rate
+# limits and retries. It runs on a third pool of workers and only checks out a
+# connection for each query it makes, so a slow upstream never ties up the
+# connection pool or the workers that other requests query through.
+#
+################################################################################
+
+T = TypeVar("T")
+
+executor: Optional[ThreadPoolExecutor] = None
+checkout_executor: Optional[ThreadPoolExecutor] = None
+fetch_executor: Optional[ThreadPoolExecutor] = None
+
+
+def open_executor(max_workers: int):
+    global executor, checkout_executor, fetch_executor
+    if executor is not None:
+        return
+    executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="api")
+    # more workers than connections would only ever wait on the pool
+    checkout_executor = ThreadPoolExecutor(
+        max_workers=max_workers, thread_name_prefix="api-checkout"
+    )
+    fetch_executor = ThreadPoolExecutor(
+        max_workers=max_workers, thread_name_prefix="api-fetch"
+    )
+
+
+def close_executor():
+    global executor, checkout_executor, fetch_executor
+    if executor is None or checkout_executor is None or fetch_executor is None:
+        return
+    fetch_executor.shutdown(wait=True)
+    checkout_executor.shutdown(wait=True)
+    executor.shutdown(wait=True)
+    executor = None
+    checkout_executor = None
+    fetch_executor = None
+
+
+def get_executor() -> ThreadPoolExecutor:
+    if executor is None:
+        raise RuntimeError("Executor has not been opened")
+    return executor
+
+
+def get_checkout_executor() -> ThreadPoolExecutor:
+    if checkout_executor is None:
+        raise RuntimeError("Executor has not been opened")
+    return checkout_executor
+
+
+def get_fetch_executor() -> ThreadPoolExecutor:
+    if fetch_executor is None:
+        raise RuntimeError("Executor has not been opened")
+    return fetch_executor
+
+
+async def run_in(executor: ThreadPoolExecutor, fn: Callable[..., T], *args) -> T:
+    loop = asyncio.get_running_loop()
+    # run_in_executor does not carry context variables over to the worker
+    context = contextvars.copy_context()
+    call = functools.partial(context.run, fn, *args)
+    return await loop.run_in_executor(executor, call)
+
+
+# for work from a handler that already holds any connection it needs
+async def run_blocking(fn: Callable[..., T], *args, **kwargs) -> T:
+    return await run_in(get_executor(), functools.partial(fn, *args, **kwargs))
+
+
+# for work that checks out a connection of its own, which is passed to fn as
+# its first argument
+async def run_checkout(fn: Callable[..., T], *args) -> T:
+    return await run_in(get_checkout_executor(), run_with_cursor, fn, *args)
+
+
+# for work that fetches from upstream services, checking out a connection only
+# for the queries it makes along the way
+async def run_fetch(fn: Callable[..., T], *args) -> T:
+    return await run_in(get_fetch_executor(), fn, *args)
@@ -0,0 +1,87 @@
+from array import array
+from bisect import bisect_left, bisect_right
+from dataclasses import dataclass
+from typing import Literal, Optional, get_args
+
+from database.methods import named_query, select
+from database.schema import corpus_location_table
+from structs.network import CorpusLocation
+
+################################################################################
+#
+# CORPUS index
+#
+# CORPUS translates between the codes used for locations on the network. Each
+# kind of code is held as a sorted list of codes alongside an array of the
+# rows they belong to, so a lookup is a binary search and the index costs a few
+# bytes per code on top of the strings themselves, rather than a dict entry and
+# a list for every code.
+#
+################################################################################
+
+CorpusCodeType = Literal["crs", "tiploc", "stanox", "nlc", "uic"]
+corpus_code_types: list[str] = list(get_args(CorpusCodeType))
+
+
+@dataclass
+class CorpusCodes:
+    codes: list[str]
+    rows: array
+
+
+@dataclass
+class CorpusIndex:
+    locations: list[CorpusLocation]
+    codes: dict[str, CorpusCodes]
+
+
+def get_location_code(location: CorpusLocation, code_type: str) -> Optional[str]:
+    return getattr(location, code_type)
+
+
+def make_corpus_codes(locations: list[CorpusLocation], code_type: str) -> CorpusCodes:
+    entries = []
+    for i, location in enumerate(locations):
+        code = get_location_code(location, code_type)
+        if code is not None:
+            entries.append((code, i))
+    entries.sort()
+    codes = list(map(lambda entry: entry[0], entries))
+    rows = array("i", map(lambda entry: entry[1], entries))
+    return CorpusCodes(codes, rows)
+
+
+def make_corpus_index(locations: list[CorpusLocation]) -> CorpusIndex:
+    codes = {
+        code_type: make_corpus_codes(locations, code_type)
+        for code_type in corpus_code_types
+    }
+    return CorpusIndex(locations, codes)
+
+
+@named_query
+def select_all_corpus_locations(cur) -> list[CorpusLocation]:
+    rows = select(
+        cur,
+        ["tiploc", "stanox", "crs", "nlc", "uic", "name", "short_name"],
+        corpus_location_table,
+    )
+    return list(map(lambda row: CorpusLocation(*row), rows))
+
+
+def get_corpus_rows(index: CorpusIndex, code_type: str, code: str) -> list[int]:
+    entries = index.codes[code_type]
+    start = bisect_left(entries.codes, code)
+    end = bisect_right(entries.codes, code, lo=start)
+    return list(entries.rows[start:end])
+
+
+def query_corpus_index(
+    index: CorpusIndex, code: str, code_type: Optional[CorpusCodeType] = None
+) -> list[CorpusLocation]:
+    code = code.upper()
+    code_types = corpus_code_types if code_type is None else [code_type]
+    rows: set[int] = set()
+    for current in code_types:
+        rows.update(get_corpus_rows(index, current, code))
+    return list(map(lambda row: index.locations[row], sorted(rows)))
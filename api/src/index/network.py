@@ -0,0 +1,89 @@
+import heapq
+import math
+
+from array import array
+from dataclasses import dataclass
+from typing import Iterable, Optional
+
+from database.methods import named_query, select_query
+from database.schema import network_link_table
+
+################################################################################
+#
+# Network graph
+#
+# The links between timing points in BPLAN are held as a graph in compressed
+# sparse row form: the links leaving each timing point sit next to each other
+# in flat arrays of targets and distances, with an array of offsets saying
+# where each timing point's links start. Links are treated as running in both
+# directions, as only the length of the track is of interest.
+#
+################################################################################
+
+
+@dataclass
+class NetworkGraph:
+    tiplocs: list[str]
+    nodes: dict[str, int]
+    # the links leaving node i are at offsets[i] up to offsets[i + 1]
+    offsets: array
+    targets: array
+    # metres
+    distances: array
+
+
+def make_network_graph(links: Iterable[tuple[str, str, int]]) -> NetworkGraph:
+    nodes: dict[str, int] = {}
+    edges = []
+    for origin, destination, distance in links:
+        start = nodes.setdefault(origin, len(nodes))
+        end = nodes.setdefault(destination, len(nodes))
+        edges.append((start, end, distance))
+        edges.append((end, start, distance))
+    edges.sort()
+    offsets = array("i", [0] * (len(nodes) + 1))
+    for start, _, _ in edges:
+        offsets[start + 1] = offsets[start + 1] + 1
+    for i in range(len(nodes)):
+        offsets[i + 1] = offsets[i + 1] + offsets[i]
+    targets = array("i", map(lambda edge: edge[1], edges))
+    distances = array("i", map(lambda edge: edge[2], edges))
+    return NetworkGraph(list(nodes.keys()), nodes, offsets, targets, distances)
+
+
+@named_query
+def select_all_network_links(cur) -> list[tuple[str, str, int]]:
+    # timing points are often joined by several running lines, of which only
+    # the shortest matters
+    statement = f"""
+        SELECT origin, destination, MIN(distance)
+        FROM {network_link_table}
+        WHERE distance IS NOT NULL AND origin <> destination
+        GROUP BY origin, destination
+    """
+    return select_query(cur, statement)
+
+
+def get_shortest_distance(
+    graph: NetworkGraph, origin: str, destination: str
+) -> Optional[int]:
+    start = graph.nodes.get(origin)
+    end = graph.nodes.get(destination)
+    if start is None or end is None:
+        return None
+    best = {start: 0}
+    queue = [(0, start)]
+    while len(queue) > 0:
+        (distance, node) = heapq.heappop(queue)
+        if node == end:
+            return distance
+        if distance > best[node]:
+            # already reached by a shorter route
+            continue
+        for i in range(graph.offsets[node], graph.offsets[node + 1]):
+            target = graph.targets[i]
+            candidate = distance + graph.distances[i]
+            if candidate < best.get(target, math.inf):
+                best[target] = candidate
+                heapq.heappush(queue, (candidate, target))
+    return None
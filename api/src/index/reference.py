@@ -0,0 +1,237 @@
+from dataclasses import dataclass
+from threading import Lock
+from typing import Optional
+
+import arrow
+
+from database.methods import named_query, select, select_query
+from database.schema import *
+from index.corpus import (
+    CorpusCodeType,
+    CorpusIndex,
+    make_corpus_index,
+    query_corpus_index,
+    select_all_corpus_locations,
+)
+from index.network import (
+    NetworkGraph,
+    get_shortest_distance,
+    make_network_graph,
+    select_all_network_links,
+)
+from index.spatial import SpatialIndex, make_spatial_index
+from structs.bus import BusRoute
+from structs.network import CorpusLocation
+from structs.train import (
+    Brand,
+    ServiceLookups,
+    TocData,
+    TrainStationDataSlimline,
+    make_brand_lookups,
+    make_station_slimline,
+)
+
+################################################################################
+#
+# Reference data index
+#
+# Stations, tocs, brands and colours change rarely, so they are loaded into
+# memory when the API starts and looked up from there instead of from the
+# database, along with spatial indexes of every station and bus stop, the
+# CORPUS translations between location codes and the BPLAN track network.
+# Reloading builds a complete new index before swapping it in, so requests never
+# see a partially loaded index.
+#
+################################################################################
+
+
+@dataclass
+class ReferenceIndex:
+    version: int
+    loaded: str
+    # keyed by both crs and name
+    stations: dict[str, TrainStationDataSlimline]
+    # keyed by both atoc and name
+    tocs: dict[str, TocData]
+    # keyed by slug
+    bus_routes: dict[str, BusRoute]
+    lookups: ServiceLookups
+    # keyed by crs
+    station_locations: SpatialIndex
+    # keyed by atco
+    bus_stop_locations: SpatialIndex
+    corpus: CorpusIndex
+    network: NetworkGraph
+
+
+@named_query
+def select_all_stations(cur) -> list[TrainStationDataSlimline]:
+    statement = f"""
+        SELECT
+            {train_station_table}.name,
+            {train_station_table}.crs,
+            {train_station_table}.lat,
+            {train_station_table}.lon,
+            {toc_table}.name AS operator_name,
+            {toc_table}.atoc AS operator_atoc,
+            {colour_table}.fg AS operator_fg,
+            {colour_table}.bg AS operator_bg
+        FROM
+            {train_station_table}
+        INNER JOIN
+            {toc_table}
+        ON
+            {train_station_table}.operator = {toc_table}.atoc
+        INNER JOIN
+            {colour_table}
+        ON
+            {toc_table}.atoc = {colour_table}.code
+        WHERE
+            {colour_table}.fg IS NOT NULL
+            AND
+            {colour_table}.bg IS NOT NULL
+    """
+    rows = select_query(cur, statement)
+    return list(map(make_station_slimline, rows))
+
+
+@named_query
+def select_all_tocs(cur) -> list[TocData]:
+    # a toc without colours cannot be served, but should not stop the rest of
+    # the reference data from loading
+    rows = select(
+        cur,
+        ["toc.name", "toc.atoc", "colour.fg", "colour.bg"],
+        f"{toc_table} INNER JOIN {colour_table} ON toc.atoc = colour.code",
+        ["colour.fg IS NOT NULL", "colour.bg IS NOT NULL"],
+    )
+    brand_rows = select(
+        cur, ["parent", "atoc", "endpoints"], brand_table, ["endpoints IS NOT NULL"]
+    )
+    brands: dict[str, list[Brand]] = {}
+    for row in brand_rows:
+        brands.setdefault(row[0], []).append(Brand(row[1], row[2]))
+    return list(
+        map(
+            lambda row: TocData(row[0], row[1], row[2], row[3], brands.get(row[1], [])),
+            rows,
+        )
+    )
+
+
+@named_query
+def select_all_bus_routes(cur) -> dict[str, BusRoute]:
+    rows = select(
+        cur,
+        ["code", "fg", "bg"],
+        colour_table,
+        ["type = %(type)s"],
+        {"type": "bus"},
+    )
+    return {row[0]: BusRoute(row[1], row[2]) for row in rows}
+
+
+@named_query
+def select_all_bus_stop_locations(cur) -> list[tuple[str, float, float]]:
+    return select(cur, ["atco", "lat", "lon"], bus_stop_table)
+
+
+reference_index: Optional[ReferenceIndex] = None
+reference_index_lock = Lock()
+
+
+def load_reference_index(cur) -> ReferenceIndex:
+    global reference_index
+    stations: dict[str, TrainStationDataSlimline] = {}
+    for station in select_all_stations(cur):
+        stations[station.name] = station
+        stations[station.crs] = station
+    tocs: dict[str, TocData] = {}
+    for toc in select_all_tocs(cur):
+        tocs[toc.name] = toc
+        tocs[toc.atoc] = toc
+    bus_routes = select_all_bus_routes(cur)
+    station_locations = make_spatial_index(
+        map(
+            lambda station: (station.crs, station.lat, station.lon),
+            # stations are keyed by name as well as crs
+            {station.crs: station for station in stations.values()}.values(),
+        )
+    )
+    bus_stop_locations = make_spatial_index(select_all_bus_stop_locations(cur))
+    corpus = make_corpus_index(select_all_corpus_locations(cur))
+    network = make_network_graph(select_all_network_links(cur))
+    with reference_index_lock:
+        version = 1 if reference_index is None else reference_index.version + 1
+        index = ReferenceIndex(
+            version,
+            arrow.now().format(),
+            stations,
+            tocs,
+            bus_routes,
+            ServiceLookups(stations, tocs, make_brand_lookups(tocs)),
+            station_locations,
+            bus_stop_locations,
+            corpus,
+            network,
+        )
+        reference_index = index
+    return index
+
+
+def get_reference_index() -> ReferenceIndex:
+    index = reference_index
+    if index is None:
+        raise RuntimeError("Reference index has not been loaded")
+    return index
+
+
+def lookup_train_station(descriptor: str) -> Optional[TrainStationDataSlimline]:
+    return get_reference_index().stations.get(descriptor)
+
+
+def lookup_toc(descriptor: str) -> Optional[TocData]:
+    return get_reference_index().tocs.get(descriptor)
+
+
+def lookup_bus_route(slug: str) -> Optional[BusRoute]:
+    return get_reference_index().bus_routes.get(slug)
+
+
+def lookup_corpus_locations(
+    code: str, code_type: Optional[CorpusCodeType] = None
+) -> list[CorpusLocation]:
+    return query_corpus_index(get_reference_index().corpus, code, code_type)
+
+
+def lookup_network_distance(origin: str, destination: str) -> Optional[int]:
+    return get_shortest_distance(get_reference_index().network, origin, destination)
+
+
+@dataclass
+class ReferenceIndexStats:
+    version: int
+    loaded: str
+    stations: int
+    tocs: int
+    bus_routes: int
+    bus_stops: int
+    corpus_locations: int
+    timing_points: int
+    network_links: int
+
+
+def get_reference_index_stats() -> ReferenceIndexStats:
+    index = get_reference_index()
+    return ReferenceIndexStats(
+        index.version,
+        index.loaded,
+        len(set(map(lambda station: station.crs, index.stations.values()))),
+        len(set(map(lambda toc: toc.atoc, index.tocs.values()))),
+        len(index.bus_routes),
+        len(index.bus_stop_locations.ids),
+        len(index.corpus.locations),
+        len(index.network.tiplocs),
+        # every link is stored once in each direction
+        len(index.network.targets) // 2,
+    )
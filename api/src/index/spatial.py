@@ -0,0 +1,87 @@
+import heapq
+import math
+
+from array import array
+from dataclasses import dataclass
+from typing import Iterable
+
+################################################################################
+#
+# Spatial index
+#
+# Points are bucketed into a grid of fixed size cells of latitude and
+# longitude. A radius query only has to measure the distance to the points in
+# the handful of cells that the circle overlaps, rather than to every point.
+#
+################################################################################
+
+earth_radius = 6371008.8
+metres_per_degree = math.pi * earth_radius / 180
+
+# roughly 1.1km north to south and 0.7km east to west across Great Britain
+default_cell_size = 0.01
+
+
+@dataclass
+class SpatialIndex:
+    cell_size: float
+    ids: list[str]
+    lats: array
+    lons: array
+    cells: dict[tuple[int, int], array]
+
+
+def get_cell(cell_size: float, lat: float, lon: float) -> tuple[int, int]:
+    return (math.floor(lat / cell_size), math.floor(lon / cell_size))
+
+
+def make_spatial_index(
+    points: Iterable[tuple[str, float, float]], cell_size: float = default_cell_size
+) -> SpatialIndex:
+    ids = []
+    lats = array("d")
+    lons = array("d")
+    cells: dict[tuple[int, int], array] = {}
+    for i, (id, lat, lon) in enumerate(points):
+        ids.append(id)
+        lats.append(lat)
+        lons.append(lon)
+        cell = get_cell(cell_size, lat, lon)
+        if cell not in cells:
+            cells[cell] = array("i")
+        cells[cell].append(i)
+    return SpatialIndex(cell_size, ids, lats, lons, cells)
+
+
+def get_distance(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+    phi1 = math.radians(lat1)
+    phi2 = math.radians(lat2)
+    dphi = phi2 - phi1
+    dlambda = math.radians(lon2 - lon1)
+    a = (
+        math.sin(dphi / 2) ** 2
+        + math.cos(phi1) * math.cos(phi2) * math.sin(dlambda / 2) ** 2
+    )
+    return 2 * earth_radius * math.asin(math.sqrt(a))
+
+
+def query_spatial_index(
+    index: SpatialIndex, lat: float, lon: float, radius: float, limit: int
+) -> list[tuple[str, float]]:
+    lat_span = radius / metres_per_degree
+    # degrees of longitude shrink towards the poles
+    lon_span = lat_span / max(math.cos(math.radians(lat)), 0.01)
+    (min_row, min_col) = get_cell(index.cell_size, lat - lat_span, lon - lon_span)
+    (max_row, max_col) = get_cell(index.cell_size, lat + lat_span, lon + lon_span)
+    matches = []
+    for row in range(min_row, max_row + 1):
+        for col in range(min_col, max_col + 1):
+            cell = index.cells.get((row, col))
+            if cell is None:
+                continue
+            for i in cell:
+                distance = get_distance(lat, lon, index.lats[i], index.lons[i])
+                if distance <= radius:
+                    matches.append((distance, i))
+    nearest = heapq.nsmallest(limit, matches)
+    return list(map(lambda match: (index.ids[match[1]], match[0]), nearest))
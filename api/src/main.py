@@ -1,81 +1,584 @@
 import arrow
+import asyncio
+import secrets
+import signal
 
 from arrow import Arrow
-from fastapi import FastAPI, HTTPException
-from credentials import get_api_credentials
+from contextlib import asynccontextmanager
+from datetime import date
+from threading import current_thread, main_thread
+from typing import Optional
+from fastapi import Depends, FastAPI, HTTPException, Query, Response
+from fastapi.middleware.gzip import GZipMiddleware
+from fastapi.security import HTTPBasic, HTTPBasicCredentials
+from credentials import admin, get_api_credentials
 
 from pydantic.dataclasses import dataclass
 
-from database.methods import connect, disconnect
+from database.pool import (
+    PoolStats,
+    close_pool,
+    get_cursor,
+    get_pool,
+    get_pool_stats,
+    open_pool,
+)
+from executor import (
+    close_executor,
+    open_executor,
+    run_blocking,
+    run_checkout,
+    run_fetch,
+)
+from middleware import QueryCountMiddleware, RevalidateMiddleware, TimingMiddleware
+from metrics import (
+    MetricFamily,
+    Sample,
+    register_collector,
+    render_metrics,
+)
+from pull.cache import CacheStats
+from pull.client import ClientStats, get_client_stats
+from serialise import (
+    cache_response,
+    clear_response_cache,
+    encoded_response,
+    get_cached_response,
+    get_response_cache_stats,
+    immutable_cache_control,
+    reference_cache_control,
+)
+from index.corpus import CorpusCodeType
+from index.spatial import query_spatial_index
+from index.reference import (
+    ReferenceIndexStats,
+    get_reference_index,
+    get_reference_index_stats,
+    load_reference_index,
+    lookup_bus_route,
+    lookup_corpus_locations,
+    lookup_network_distance,
+    lookup_toc,
+    lookup_train_station,
+)
 
-from structs.bus import BusStop, BusRoute, select_bus_route, select_bus_stop
+from structs.bus import (
+    BusStop,
+    BusRoute,
+    NearbyBusStop,
+    search_bus_stops,
+    select_bus_stop,
+    select_bus_stops,
+)
+from structs.network import CorpusLocation
 from structs.train import (
+    NearbyTrainStation,
+    RttCacheStats,
     TocData,
     TrainService,
     TrainStation,
-    TrainStationData,
+    TrainStationDataSlimline,
+    get_rtt_cache_stats,
+    get_service_json,
+    get_service_lookups,
+    is_service_complete,
+    is_valid_service_json,
+    make_service,
     pull_service,
-    select_toc,
-    select_train_station,
+    search_train_stations,
 )
 
-app = FastAPI()
+
+async def reload_reference_data():
+    await run_checkout(load_reference_index)
+    # responses built from the old index are keyed by its version so can never
+    # be served again
+    clear_response_cache()
+
+
+# the event loop only keeps weak references to tasks, so reloads started by a
+# signal are kept here until they finish
+reload_tasks: set[asyncio.Task] = set()
+
+
+def on_reload_done(task: asyncio.Task):
+    reload_tasks.discard(task)
+    if not task.cancelled() and task.exception() is not None:
+        print(f"Could not reload reference data: {task.exception()!r}")
+
+
+def start_reload():
+    task = asyncio.create_task(reload_reference_data())
+    reload_tasks.add(task)
+    task.add_done_callback(on_reload_done)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    open_pool()
+    open_executor(get_pool().config.max_size)
+    await reload_reference_data()
+    # reference data can be reloaded without a restart by sending SIGHUP, but
+    # signal handlers can only be added when the loop runs in the main thread,
+    # so when embedded elsewhere /admin/reload is the only way
+    if hasattr(signal, "SIGHUP") and current_thread() is main_thread():
+        asyncio.get_running_loop().add_signal_handler(signal.SIGHUP, start_reload)
+    yield
+    close_executor()
+    close_pool()
+
+
+app = FastAPI(lifespan=lifespan)
+
+
+# each one added wraps those added before it, so compression is innermost and
+# timing outermost; brotli would need another dependency
+app.add_middleware(GZipMiddleware, minimum_size=1024)
+app.add_middleware(RevalidateMiddleware)
+app.add_middleware(QueryCountMiddleware)
+app.add_middleware(TimingMiddleware)
+
+
+@dataclass
+class Stats:
+    pool: PoolStats
+    rtt_cache: RttCacheStats
+    reference_index: ReferenceIndexStats
+    response_cache: CacheStats
+    upstream: ClientStats
+
+
+@app.get("/stats", response_model=Stats)
+async def get_stats():
+    return Stats(
+        get_pool_stats(),
+        get_rtt_cache_stats(),
+        get_reference_index_stats(),
+        get_response_cache_stats(),
+        get_client_stats(),
+    )
+
+
+def make_gauge(name: str, help: str, value: float) -> MetricFamily:
+    return MetricFamily(name, "gauge", help, [Sample({}, value)])
+
+
+def make_counter(name: str, help: str, value: float) -> MetricFamily:
+    return MetricFamily(name, "counter", help, [Sample({}, value)])
+
+
+def get_hit_ratio(stats: CacheStats) -> float:
+    lookups = stats.hits + stats.misses
+    return stats.hits / lookups if lookups > 0 else 0
+
+
+def collect_stats_metrics() -> list[MetricFamily]:
+    pool = get_pool_stats()
+    rtt_cache = get_rtt_cache_stats()
+    caches = {"rtt": rtt_cache.memory, "response": get_response_cache_stats()}
+    upstream = get_client_stats()
+    return [
+        make_gauge("db_pool_max", "Most connections the pool can hold", pool.max_size),
+        make_gauge("db_pool_in_use", "Connections checked out", pool.in_use),
+        make_gauge("db_pool_idle", "Connections open but not in use", pool.idle),
+        make_gauge(
+            "db_pool_waiting", "Checkouts waiting for a connection", pool.waiting
+        ),
+        make_gauge(
+            "db_pool_saturation",
+            "Fraction of the pool checked out",
+            pool.in_use / pool.max_size,
+        ),
+        make_counter(
+            "db_pool_checkouts_total", "Connections checked out", pool.checkouts
+        ),
+        make_counter(
+            "db_pool_discarded_total", "Broken connections replaced", pool.discarded
+        ),
+        MetricFamily(
+            "cache_hits_total",
+            "counter",
+            "In-memory cache hits",
+            [Sample({"cache": name}, stats.hits) for name, stats in caches.items()],
+        ),
+        MetricFamily(
+            "cache_misses_total",
+            "counter",
+            "In-memory cache misses",
+            [Sample({"cache": name}, stats.misses) for name, stats in caches.items()],
+        ),
+        MetricFamily(
+            "cache_hit_ratio",
+            "gauge",
+            "Fraction of in-memory cache lookups that hit",
+            [
+                Sample({"cache": name}, get_hit_ratio(stats))
+                for name, stats in caches.items()
+            ],
+        ),
+        MetricFamily(
+            "cache_entries",
+            "gauge",
+            "Entries held in memory",
+            [Sample({"cache": name}, stats.size) for name, stats in caches.items()],
+        ),
+        make_counter(
+            "rtt_database_hits_total",
+            "Services found in the database cache",
+            rtt_cache.database_hits,
+        ),
+        make_counter(
+            "rtt_upstream_fetches_total",
+            "Services fetched from RTT",
+            rtt_cache.upstream_fetches,
+        ),
+        make_counter(
+            "rtt_coalesced_total",
+            "Service requests that shared a load already in progress",
+            rtt_cache.flights.coalesced,
+        ),
+        make_counter(
+            "upstream_requests_total", "Requests sent upstream", upstream.requests
+        ),
+        make_counter(
+            "upstream_retries_total", "Upstream requests retried", upstream.retries
+        ),
+        make_counter(
+            "upstream_failures_total",
+            "Upstream requests that failed on every attempt",
+            upstream.failures,
+        ),
+        make_counter(
+            "upstream_throttled_seconds_total",
+            "Time spent waiting on upstream rate limits",
+            upstream.throttled_seconds,
+        ),
+    ]
+
+
+register_collector(collect_stats_metrics)
+
+
+@app.get("/metrics")
+async def get_metrics():
+    return Response(
+        render_metrics(), media_type="text/plain; version=0.0.4; charset=utf-8"
+    )
+
+
+# responses built only from the reference index cannot change until it is
+# reloaded, so they are cached under its version
+def get_reference_key(*parts) -> tuple:
+    return (get_reference_index().version, *parts)
+
+
+admin_security = HTTPBasic()
+
+
+# admin endpoints need the ADMIN_USER and ADMIN_PASSWD from .env, and are
+# refused to everyone when those are not set
+def check_admin(credentials: HTTPBasicCredentials = Depends(admin_security)):
+    try:
+        expected = get_api_credentials(admin)
+    except RuntimeError:
+        expected = None
+    if (
+        expected is None
+        or not secrets.compare_digest(
+            credentials.username.encode(), expected.user.encode()
+        )
+        or not secrets.compare_digest(
+            credentials.password.encode(), expected.password.encode()
+        )
+    ):
+        raise HTTPException(
+            status_code=401,
+            detail="Invalid admin credentials",
+            headers={"WWW-Authenticate": "Basic"},
+        )
+
+
+@app.post(
+    "/admin/reload",
+    response_model=ReferenceIndexStats,
+    dependencies=[Depends(check_admin)],
+)
+async def reload():
+    await reload_reference_data()
+    return get_reference_index_stats()
 
 
 @app.get("/bus/stop/{atco}", response_model=BusStop)
-async def get_stop(atco: str):
-    (conn, cur) = connect()
-    stop = select_bus_stop(cur, atco)
-    disconnect(conn, cur)
+async def get_stop(atco: str, cur=Depends(get_cursor)):
+    stop = await run_blocking(select_bus_stop, cur, atco)
     if stop is None:
         raise HTTPException(status_code=404, detail=f"Atco {atco} not found")
-    return stop
+    return encoded_response(BusStop, stop, reference_cache_control)
+
+
+max_bus_stop_batch_size = 500
+
+
+@app.get("/bus/stops", response_model=list[BusStop])
+async def get_stops(atco: list[str] = Query(), cur=Depends(get_cursor)):
+    if len(atco) > max_bus_stop_batch_size:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Cannot request more than {max_bus_stop_batch_size} stops",
+        )
+    return await run_blocking(select_bus_stops, cur, atco)
+
+
+max_near_radius = 5000
+max_near_limit = 100
+
+
+@app.get("/bus/stops/near", response_model=list[NearbyBusStop])
+async def get_stops_near(
+    lat: float,
+    lon: float,
+    radius: float = Query(default=500, gt=0, le=max_near_radius),
+    limit: int = Query(default=10, gt=0, le=max_near_limit),
+    cur=Depends(get_cursor),
+):
+    index = get_reference_index().bus_stop_locations
+    nearest = query_spatial_index(index, lat, lon, radius, limit)
+    if len(nearest) == 0:
+        return []
+    stops = await run_blocking(
+        select_bus_stops, cur, list(map(lambda match: match[0], nearest))
+    )
+    stops_by_atco = {stop.atco: stop for stop in stops}
+    return [
+        NearbyBusStop(stops_by_atco[atco], distance)
+        for (atco, distance) in nearest
+        if atco in stops_by_atco
+    ]
 
 
 @app.get("/bus/route/{slug}", response_model=BusRoute)
 async def get_route(slug: str):
-    (conn, cur) = connect()
-    route = select_bus_route(cur, slug)
-    disconnect(conn, cur)
+    key = get_reference_key("bus_route", slug)
+    cached = get_cached_response(key)
+    if cached is not None:
+        return cached
+    route = lookup_bus_route(slug)
     if route is None:
         raise HTTPException(status_code=404, detail=f"Slug {slug} not found")
-    return route
+    return cache_response(key, BusRoute, route)
 
 
-@app.get("/train/station/{descriptor}", response_model=TrainStationData)
+@app.get("/train/station/{descriptor}", response_model=TrainStationDataSlimline)
 async def get_station(descriptor: str):
-    (conn, cur) = connect()
-    station = select_train_station(cur, descriptor)
-    disconnect(conn, cur)
+    key = get_reference_key("station", descriptor)
+    cached = get_cached_response(key)
+    if cached is not None:
+        return cached
+    station = lookup_train_station(descriptor)
     if station is None:
         raise HTTPException(
             status_code=404, detail=f"Station with descriptor {descriptor} not found"
         )
-    return station
+    return cache_response(key, TrainStationDataSlimline, station)
+
+
+@app.get("/train/stations/near", response_model=list[NearbyTrainStation])
+async def get_stations_near(
+    lat: float,
+    lon: float,
+    radius: float = Query(default=2000, gt=0, le=max_near_radius),
+    limit: int = Query(default=10, gt=0, le=max_near_limit),
+):
+    index = get_reference_index()
+    nearest = query_spatial_index(index.station_locations, lat, lon, radius, limit)
+    stations = [
+        NearbyTrainStation(index.stations[crs], distance) for (crs, distance) in nearest
+    ]
+    return encoded_response(list[NearbyTrainStation], stations)
 
 
 @app.get("/train/toc/{atoc}", response_model=TocData)
 async def get_toc(atoc: str):
-    (conn, cur) = connect()
-    toc = select_toc(cur, atoc)
-    disconnect(conn, cur)
+    key = get_reference_key("toc", atoc)
+    cached = get_cached_response(key)
+    if cached is not None:
+        return cached
+    toc = lookup_toc(atoc)
     if toc is None:
         raise HTTPException(status_code=404, detail=f"Toc with atoc {atoc} not found")
-    return toc
+    return cache_response(key, TocData, toc)
+
+
+@app.get("/train/location/{code}", response_model=list[CorpusLocation])
+async def get_locations(code: str):
+    key = get_reference_key("location", code)
+    cached = get_cached_response(key)
+    if cached is not None:
+        return cached
+    locations = lookup_corpus_locations(code)
+    if len(locations) == 0:
+        raise HTTPException(
+            status_code=404, detail=f"Location with code {code} not found"
+        )
+    return cache_response(key, list[CorpusLocation], locations)
+
+
+@app.get("/train/location/{code_type}/{code}", response_model=list[CorpusLocation])
+async def get_locations_by_type(code_type: CorpusCodeType, code: str):
+    key = get_reference_key("location", code_type, code)
+    cached = get_cached_response(key)
+    if cached is not None:
+        return cached
+    locations = lookup_corpus_locations(code, code_type)
+    if len(locations) == 0:
+        raise HTTPException(
+            status_code=404, detail=f"Location with {code_type} {code} not found"
+        )
+    return cache_response(key, list[CorpusLocation], locations)
+
+
+metres_per_mile = 1609.344
+
+
+@dataclass
+class NetworkDistance:
+    origin: str
+    destination: str
+    metres: int
+    miles: float
+
+
+@app.get("/train/distance/{origin}/{destination}", response_model=NetworkDistance)
+async def get_network_distance(origin: str, destination: str):
+    origin = origin.upper()
+    destination = destination.upper()
+    key = get_reference_key("distance", origin, destination)
+    cached = get_cached_response(key)
+    if cached is not None:
+        return cached
+    # searching a long way across the network takes long enough that it should
+    # not hold up the event loop
+    metres = await run_blocking(lookup_network_distance, origin, destination)
+    if metres is None:
+        raise HTTPException(
+            status_code=404,
+            detail=f"No route across the network from {origin} to {destination}",
+        )
+    distance = NetworkDistance(origin, destination, metres, metres / metres_per_mile)
+    return cache_response(key, NetworkDistance, distance)
 
 
 @app.get("/train/service/{id}/{year}/{month}/{day}", response_model=TrainService)
 async def get_service(id: str, year: int, month: int, day: int):
     run_date = arrow.get(year, month, day)
-    (conn, cur) = connect()
-    try:
-        service = pull_service(cur, id, run_date, get_api_credentials("RTT"))
-    except Exception as e:
-        disconnect(conn, cur)
-        raise e
-    disconnect(conn, cur)
+    complete = is_service_complete(run_date)
+    key = ("service", id, run_date.date())
+    if complete:
+        cached = get_cached_response(key)
+        if cached is not None:
+            return cached
+    # no connection is held while the service is fetched from RTT
+    service = await run_fetch(
+        pull_service,
+        id,
+        run_date,
+        get_api_credentials("RTT"),
+        get_reference_index().lookups,
+    )
     if service is None:
         raise HTTPException(
             status_code=404, detail=f"Service {id} did not run on {year}-{month}-{day}"
         )
-    return service
+    if complete:
+        return cache_response(key, TrainService, service, immutable_cache_control)
+    return encoded_response(TrainService, service)
+
+
+@dataclass
+class TrainServiceRequest:
+    id: str
+    date: date
+
+
+@dataclass(config=dict(arbitrary_types_allowed=True))
+class TrainServiceResult:
+    id: str
+    date: date
+    service: Optional[TrainService]
+    error: Optional[str]
+
+
+max_service_batch_size = 64
+
+
+@app.post("/train/services", response_model=list[TrainServiceResult])
+async def get_services(items: list[TrainServiceRequest]):
+    if len(items) > max_service_batch_size:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Cannot request more than {max_service_batch_size} services",
+        )
+    credentials = get_api_credentials("RTT")
+    run_dates = list(map(lambda item: arrow.get(item.date), items))
+    # each fetch checks out connections of its own, and only while querying, so
+    # that they can run in parallel without holding the pool while RTT answers
+    jsons = await asyncio.gather(
+        *[
+            run_fetch(get_service_json, item.id, run_date, credentials)
+            for (item, run_date) in zip(items, run_dates)
+        ],
+        return_exceptions=True,
+    )
+    valid_jsons = [
+        json for json in jsons if isinstance(json, dict) and is_valid_service_json(json)
+    ]
+    lookups = await run_checkout(
+        get_service_lookups,
+        valid_jsons,
+        get_reference_index().lookups,
+    )
+    results = []
+    for item, run_date, json in zip(items, run_dates, jsons):
+        service = None
+        error = None
+        if isinstance(json, HTTPException):
+            error = json.detail
+        elif isinstance(json, BaseException):
+            error = f"Could not fetch service {item.id}"
+        elif json is None or not is_valid_service_json(json):
+            error = f"Service {item.id} did not run on {item.date}"
+        else:
+            try:
+                service = make_service(item.id, run_date, json, lookups)
+            except HTTPException as e:
+                error = e.detail
+        results.append(TrainServiceResult(item.id, item.date, service, error))
+    return encoded_response(list[TrainServiceResult], results)
+
+
+@dataclass(config=dict(arbitrary_types_allowed=True))
+class SearchResults:
+    stations: list[TrainStationDataSlimline]
+    stops: list[BusStop]
+
+
+max_search_limit = 50
+
+
+def search(cur, query: str, limit: int) -> tuple[list[str], list[BusStop]]:
+    return (
+        search_train_stations(cur, query, limit),
+        search_bus_stops(cur, query, limit),
+    )
+
+
+@app.get("/search", response_model=SearchResults)
+async def get_search(
+    q: str = Query(min_length=2),
+    limit: int = Query(default=10, gt=0, le=max_search_limit),
+    cur=Depends(get_cursor),
+):
+    (crs_codes, stops) = await run_blocking(search, cur, q, limit)
+    index = get_reference_index()
+    stations = [index.stations[crs] for crs in crs_codes if crs in index.stations]
+    return SearchResults(stations, stops)
@@ -0,0 +1,153 @@
+from bisect import bisect_left
+from dataclasses import dataclass
+from threading import Lock
+from typing import Callable
+
+################################################################################
+#
+# Metrics
+#
+# Timings and counts are gathered in memory and rendered on request in the
+# Prometheus text format. Histograms are updated as things happen; everything
+# else is read from the stats the rest of the API already keeps, by collectors
+# called when the metrics are rendered.
+#
+################################################################################
+
+# seconds, from a fast index lookup up to a slow upstream call
+default_buckets = [
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+]
+
+
+def escape_label_value(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def format_sample(name: str, labels: dict[str, str], value: float) -> str:
+    if len(labels) == 0:
+        return f"{name} {value}"
+    label_list = ",".join(
+        map(lambda item: f'{item[0]}="{escape_label_value(item[1])}"', labels.items())
+    )
+    return f"{name}{{{label_list}}} {value}"
+
+
+@dataclass
+class Sample:
+    labels: dict[str, str]
+    value: float
+
+
+@dataclass
+class MetricFamily:
+    name: str
+    type: str
+    help: str
+    samples: list[Sample]
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.type}"]
+        for sample in self.samples:
+            lines.append(format_sample(self.name, sample.labels, sample.value))
+        return lines
+
+
+class Histogram:
+    def __init__(
+        self,
+        name: str,
+        help: str,
+        labels: list[str],
+        buckets: list[float] = default_buckets,
+    ):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.buckets = buckets
+        self.lock = Lock()
+        # keyed by label values, the count in each bucket (not cumulative,
+        # with one more for values above the last bound), the sum and the count
+        self.series: dict[tuple[str, ...], tuple[list[int], float, int]] = {}
+        histograms.append(self)
+
+    def observe(self, value: float, *label_values: str):
+        i = bisect_left(self.buckets, value)
+        with self.lock:
+            series = self.series.get(label_values)
+            if series is None:
+                series = ([0] * (len(self.buckets) + 1), 0.0, 0)
+            (counts, total, count) = series
+            counts[i] = counts[i] + 1
+            self.series[label_values] = (counts, total + value, count + 1)
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self.lock:
+            series = [
+                (label_values, list(counts), total, count)
+                for label_values, (counts, total, count) in self.series.items()
+            ]
+        series.sort()
+        for label_values, counts, total, count in series:
+            labels = dict(zip(self.labels, label_values))
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative = cumulative + bucket_count
+                bucket_labels = {**labels, "le": str(bound)}
+                lines.append(
+                    format_sample(f"{self.name}_bucket", bucket_labels, cumulative)
+                )
+            lines.append(
+                format_sample(f"{self.name}_bucket", {**labels, "le": "+Inf"}, count)
+            )
+            lines.append(format_sample(f"{self.name}_sum", labels, total))
+            lines.append(format_sample(f"{self.name}_count", labels, count))
+        return lines
+
+
+histograms: list[Histogram] = []
+collectors: list[Callable[[], list[MetricFamily]]] = []
+
+
+def register_collector(collector: Callable[[], list[MetricFamily]]):
+    collectors.append(collector)
+
+
+def render_metrics() -> str:
+    lines = []
+    for histogram in histograms:
+        lines.extend(histogram.render())
+    for collector in collectors:
+        for family in collector():
+            lines.extend(family.render())
+    return "\n".join(lines) + "\n"
+
+
+request_duration = Histogram(
+    "api_request_duration_seconds",
+    "Time taken to handle a request",
+    ["method", "route", "status"],
+)
+query_duration = Histogram(
+    "db_query_duration_seconds",
+    "Time taken by database queries, by the name of the function making them",
+    ["query"],
+)
+upstream_duration = Histogram(
+    "upstream_request_duration_seconds",
+    "Time taken by requests to upstream services, until the headers arrive",
+    ["host", "method", "status"],
+)
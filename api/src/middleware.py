@@ -0,0 +1,123 @@
+import time
+
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from database.methods import QueryCounter, query_counter
+from metrics import request_duration
+from serialise import etag_matches, get_encoded_etag
+
+################################################################################
+#
+# Middleware
+#
+# Written against ASGI directly rather than with @app.middleware, which streams
+# every response body on to the next layer in pieces. Compression only sees the
+# size of a body it is given whole, so small responses would be gzipped too.
+# These only look at or change the headers and pass the body through as it is.
+#
+################################################################################
+
+
+class TimingMiddleware:
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        start = time.perf_counter()
+        status = "500"
+
+        async def send_timed(message: Message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = str(message["status"])
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_timed)
+        finally:
+            # the route template rather than the path, so that every service is
+            # counted under the same route
+            route = scope.get("route")
+            path = route.path if route is not None else "unmatched"
+            request_duration.observe(
+                time.perf_counter() - start, scope["method"], path, status
+            )
+
+
+class QueryCountMiddleware:
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        counter = QueryCounter()
+        query_counter.set(counter)
+
+        async def send_counted(message: Message):
+            if message["type"] == "http.response.start":
+                headers = MutableHeaders(scope=message)
+                headers["X-Query-Count"] = str(counter.count)
+            await send(message)
+
+        await self.app(scope, receive, send_counted)
+
+
+# headers a 304 keeps from the response it stands in for
+not_modified_headers = ["ETag", "Cache-Control", "Vary"]
+
+
+# Answers a GET whose If-None-Match matches the ETag of the response with 304.
+# This goes outside compression, which keeps the ETag of the uncompressed body,
+# so that the ETag of a compressed response can be told apart from it here.
+class RevalidateMiddleware:
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        if_none_match = None
+        if scope["method"] in ["GET", "HEAD"]:
+            if_none_match = Headers(scope=scope).get("If-None-Match")
+        not_modified = False
+
+        async def send_revalidated(message: Message):
+            nonlocal not_modified
+            if message["type"] == "http.response.start":
+                headers = MutableHeaders(scope=message)
+                etag = headers.get("ETag")
+                coding = headers.get("Content-Encoding")
+                if etag is not None and coding is not None:
+                    etag = get_encoded_etag(etag, coding)
+                    headers["ETag"] = etag
+                if (
+                    message["status"] == 200
+                    and etag is not None
+                    and etag_matches(if_none_match, etag)
+                ):
+                    not_modified = True
+                    kept = MutableHeaders()
+                    for name in not_modified_headers:
+                        value = headers.get(name)
+                        if value is not None:
+                            kept[name] = value
+                    message = {
+                        "type": "http.response.start",
+                        "status": 304,
+                        "headers": kept.raw,
+                    }
+            elif message["type"] == "http.response.body" and not_modified:
+                # the body is dropped, but the response still has to end
+                if message.get("more_body", False):
+                    return
+                message = {"type": "http.response.body", "body": b""}
+            await send(message)
+
+        await self.app(scope, receive, send_revalidated)
@@ -2,6 +2,9 @@ import csv
 import os
 import string
 
+from pathlib import Path
+from typing import Iterator
+
 from convertbng.util import convert_lonlat  # type: ignore
 
 from pull.core import download_binary, data_directory
@@ -75,47 +78,62 @@ replacements = {
 redundant_prefixes = ["Stop", "stop", "stand", "Stand", "bay", "platform"]
 
 
-def read_naptan() -> list[BusStop]:
-    stops = []
-    with open(naptan_path, "r") as f:
+def make_bus_stop(row: list[str], stop_lat: float, stop_lon: float) -> BusStop:
+    stop_atco = row[atco]
+    if row[naptan] == "":
+        stop_naptan = None
+    else:
+        stop_naptan = row[naptan]
+    stop_name = string.capwords(row[name])
+    stop_street = string.capwords(row[street])
+    stop_landmark = string.capwords(row[landmark])
+    stop_locality = row[locality]
+    stop_parent = row[parent]
+    stop_indicator = row[indicator]
+    stop_replaced = replace_indicator(replacements, stop_indicator)
+    stop_trimmed = trim_indicator_prefixes(redundant_prefixes, stop_replaced)
+    stop_bearing = row[bearing]
+    return BusStop(
+        stop_atco,
+        stop_naptan,
+        stop_name,
+        stop_locality,
+        stop_parent,
+        stop_landmark,
+        stop_street,
+        stop_trimmed,
+        stop_bearing,
+        stop_lat,
+        stop_lon,
+    )
+
+
+def convert_naptan_rows(rows: list[list[str]]) -> Iterator[BusStop]:
+    eastings = list(map(lambda row: float(row[east]), rows))
+    northings = list(map(lambda row: float(row[north]), rows))
+    (lons, lats) = convert_lonlat(eastings, northings)
+    for row, stop_lon, stop_lat in zip(rows, lons, lats):
+        yield make_bus_stop(row, stop_lat, stop_lon)
+
+
+# rows without a latitude and longitude are held back and converted from their
+# easting and northing together, as each call to the converter has a fixed cost
+conversion_batch_size = 5000
+
+
+def read_naptan(path: str | Path = naptan_path) -> Iterator[BusStop]:
+    unconverted = []
+    with open(path, "r") as f:
         rows = csv.reader(f, delimiter=",")
         # skip the header row
         next(rows, None)
         for row in rows:
-            stop_atco = row[atco]
-            if row[naptan] == "":
-                stop_naptan = None
-            else:
-                stop_naptan = row[naptan]
-            stop_name = string.capwords(row[name])
-            stop_street = string.capwords(row[street])
-            stop_landmark = string.capwords(row[landmark])
-            stop_locality = row[locality]
-            stop_parent = row[parent]
-            stop_indicator = row[indicator]
-            stop_replaced = replace_indicator(replacements, stop_indicator)
-            stop_trimmed = trim_indicator_prefixes(redundant_prefixes, stop_replaced)
-            stop_bearing = row[bearing]
             if row[lat] == "" or row[lon] == "":
-                stop_east = float(row[east])
-                stop_north = float(row[north])
-                (lons, lats) = convert_lonlat([stop_east], [stop_north])
-                (stop_lat, stop_lon) = (lons[0], lats[0])
+                unconverted.append(row)
+                if len(unconverted) >= conversion_batch_size:
+                    yield from convert_naptan_rows(unconverted)
+                    unconverted = []
             else:
-                stop_lat = float(row[lat])
-                stop_lon = float(row[lon])
-            stop = BusStop(
-                stop_atco,
-                stop_naptan,
-                stop_name,
-                stop_locality,
-                stop_parent,
-                stop_landmark,
-                stop_street,
-                stop_trimmed,
-                stop_bearing,
-                stop_lat,
-                stop_lon,
-            )
-            stops.append(stop)
-    return stops
+                yield make_bus_stop(row, float(row[lat]), float(row[lon]))
+    if len(unconverted) > 0:
+        yield from convert_naptan_rows(unconverted)
@@ -0,0 +1,56 @@
+import time
+
+from collections import OrderedDict
+from dataclasses import dataclass
+from threading import Lock
+from typing import Generic, Hashable, Optional, TypeVar
+
+V = TypeVar("V")
+
+
+@dataclass
+class CacheStats:
+    size: int
+    capacity: int
+    hits: int
+    misses: int
+
+
+# A thread-safe least-recently-used cache, in which entries can optionally be
+# given a time to live after which they are treated as absent
+class LruCache(Generic[V]):
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self.entries: OrderedDict[Hashable, tuple[V, Optional[float]]] = OrderedDict()
+        self.lock = Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: Hashable) -> Optional[V]:
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                (value, expires) = entry
+                if expires is None or expires > time.monotonic():
+                    self.entries.move_to_end(key)
+                    self.hits = self.hits + 1
+                    return value
+                del self.entries[key]
+            self.misses = self.misses + 1
+            return None
+
+    def put(self, key: Hashable, value: V, ttl: Optional[float] = None):
+        expires = None if ttl is None else time.monotonic() + ttl
+        with self.lock:
+            self.entries[key] = (value, expires)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.capacity:
+                self.entries.popitem(last=False)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+    def stats(self) -> CacheStats:
+        with self.lock:
+            return CacheStats(len(self.entries), self.capacity, self.hits, self.misses)
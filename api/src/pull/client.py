@@ -0,0 +1,205 @@
+import random
+import time
+
+from dataclasses import dataclass
+from threading import BoundedSemaphore, Lock
+from typing import Optional
+from urllib.parse import urlsplit
+
+import requests
+
+from dotenv import dotenv_values
+from requests import Response
+from requests.adapters import HTTPAdapter
+
+from metrics import upstream_duration
+
+################################################################################
+#
+# Upstream client
+#
+# Every request to an upstream service goes through one shared session, so
+# connections are kept alive and reused instead of paying for a new TLS
+# handshake each time. Each host has a limit on how many requests can be in
+# progress at once, and hosts with a request quota also have a token bucket
+# that spaces requests out to stay within it. Requests time out rather than
+# tying up a worker forever, and GETs that fail in a way that may be transient
+# are retried after a randomised backoff.
+#
+################################################################################
+
+
+@dataclass
+class ClientConfig:
+    connect_timeout: float
+    read_timeout: float
+    host_concurrency: int
+    retries: int
+    backoff: float
+    rtt_rate: float
+    rtt_burst: int
+
+
+def get_client_config() -> ClientConfig:
+    env = dotenv_values()
+    return ClientConfig(
+        float(env.get("UPSTREAM_CONNECT_TIMEOUT") or 5),
+        float(env.get("UPSTREAM_READ_TIMEOUT") or 30),
+        int(env.get("UPSTREAM_HOST_CONCURRENCY") or 8),
+        int(env.get("UPSTREAM_RETRIES") or 3),
+        float(env.get("UPSTREAM_BACKOFF") or 0.5),
+        float(env.get("RTT_RATE") or 5),
+        int(env.get("RTT_BURST") or 10),
+    )
+
+
+class TokenBucket:
+    def __init__(self, rate: float, capacity: int):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = float(capacity)
+        self.updated = time.monotonic()
+        self.lock = Lock()
+
+    # takes a token, waiting for one to be added if the bucket is empty, and
+    # returns how long it waited
+    def acquire(self) -> float:
+        waited = 0.0
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(
+                    self.capacity, self.tokens + (now - self.updated) * self.rate
+                )
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens = self.tokens - 1
+                    return waited
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+            waited = waited + wait
+
+
+# statuses that mean the upstream may well answer if asked again shortly
+retry_statuses = [429, 500, 502, 503, 504]
+# longer waits are better left to the caller than held on a worker
+max_retry_after = 30.0
+
+
+@dataclass
+class ClientStats:
+    requests: int
+    retries: int
+    failures: int
+    throttled_seconds: float
+
+
+class Client:
+    def __init__(self, config: ClientConfig):
+        self.config = config
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=16, pool_maxsize=config.host_concurrency)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.host_limits: dict[str, BoundedSemaphore] = {}
+        self.rate_limits: dict[str, TokenBucket] = {
+            "api.rtt.io": TokenBucket(config.rtt_rate, config.rtt_burst)
+        }
+        self.lock = Lock()
+        self.requests = 0
+        self.retries = 0
+        self.failures = 0
+        self.throttled_seconds = 0.0
+
+    def get_host_limit(self, host: str) -> BoundedSemaphore:
+        with self.lock:
+            limit = self.host_limits.get(host)
+            if limit is None:
+                limit = BoundedSemaphore(self.config.host_concurrency)
+                self.host_limits[host] = limit
+            return limit
+
+    def get_backoff(self, attempt: int, response: Optional[Response]) -> float:
+        if response is not None:
+            retry_after = response.headers.get("Retry-After")
+            if retry_after is not None and retry_after.isdigit():
+                return min(float(retry_after), max_retry_after)
+        # full jitter, so that requests that failed together do not all retry
+        # together
+        return random.uniform(0, self.config.backoff * 2**attempt)
+
+    def send(self, method: str, url: str, **kwargs) -> Response:
+        host = urlsplit(url).netloc
+        bucket = self.rate_limits.get(host)
+        # only requests that cannot have changed anything upstream are retried
+        attempts = self.config.retries + 1 if method == "GET" else 1
+        timeout = (self.config.connect_timeout, self.config.read_timeout)
+        host_limit = self.get_host_limit(host)
+        for attempt in range(attempts):
+            if bucket is not None:
+                waited = bucket.acquire()
+                with self.lock:
+                    self.throttled_seconds = self.throttled_seconds + waited
+            with self.lock:
+                self.requests = self.requests + 1
+            response = None
+            start = time.perf_counter()
+            try:
+                # the limit covers sending the request and receiving its
+                # headers, but not waiting for a token, backing off before a
+                # retry or reading a streamed body
+                with host_limit:
+                    response = self.session.request(
+                        method, url, timeout=timeout, **kwargs
+                    )
+            except (requests.ConnectionError, requests.Timeout):
+                upstream_duration.observe(
+                    time.perf_counter() - start, host, method, "error"
+                )
+                if attempt == attempts - 1:
+                    with self.lock:
+                        self.failures = self.failures + 1
+                    raise
+            else:
+                upstream_duration.observe(
+                    time.perf_counter() - start, host, method, str(response.status_code)
+                )
+                if (
+                    response.status_code not in retry_statuses
+                    or attempt == attempts - 1
+                ):
+                    return response
+                response.close()
+            with self.lock:
+                self.retries = self.retries + 1
+            time.sleep(self.get_backoff(attempt, response))
+        raise RuntimeError(f"Could not get {url}")
+
+    def get(self, url: str, **kwargs) -> Response:
+        return self.send("GET", url, **kwargs)
+
+    def post(self, url: str, **kwargs) -> Response:
+        return self.send("POST", url, **kwargs)
+
+    def stats(self) -> ClientStats:
+        with self.lock:
+            return ClientStats(
+                self.requests, self.retries, self.failures, self.throttled_seconds
+            )
+
+
+client: Optional[Client] = None
+client_lock = Lock()
+
+
+def get_client() -> Client:
+    global client
+    if client is None:
+        with client_lock:
+            if client is None:
+                client = Client(get_client_config())
+    return client
+
+
+def get_client_stats() -> ClientStats:
+    return get_client().stats()
@@ -1,17 +1,16 @@
 from json import JSONDecodeError
 import xml.etree.ElementTree as ET
-import gzip
+import json
 import os
-import shutil
-import requests
 
 from pathlib import Path
-from typing import Any, Optional, TypeVar
+from typing import Iterator, Optional, Protocol, TypeVar
 from dotenv import dotenv_values
 from requests import Response
 from requests.auth import HTTPBasicAuth
 
 from credentials import Credentials
+from pull.client import get_client
 
 T = TypeVar("T")
 
@@ -28,30 +27,137 @@ data_dir = get_or_throw(env_values.get("DATA_DIR"))
 data_directory = Path(data_dir)
 
 
-def extract_gz(gz_path: str | Path, output_path: str | Path):
-    with gzip.open(gz_path, "rb") as f:
-        with open(output_path, "wb") as out:
-            shutil.copyfileobj(f, out)
-    os.remove(gz_path)
-
-
-def download_binary(url: str, path: str, credentials: Optional[Credentials] = None):
-    response = make_request(url, credentials=credentials, stream=True)
-    if response.status_code != 200:
+################################################################################
+#
+# Downloads
+#
+# Large files are streamed to disk in chunks. The ETag and Last-Modified
+# headers of each download are kept in a file next to it, so that the next
+# download can ask the server to skip the body if nothing has changed. An
+# interrupted download is left in a .part file and resumed from where it
+# stopped, provided the file on the server is still the same version.
+#
+################################################################################
+
+download_chunk_size = 1024 * 1024
+validator_headers = ["ETag", "Last-Modified"]
+
+
+def get_validators_path(path: str | Path) -> Path:
+    return Path(f"{path}.validators.json")
+
+
+def get_partial_path(path: str | Path) -> Path:
+    return Path(f"{path}.part")
+
+
+def read_validators(path: str | Path) -> dict:
+    validators_path = get_validators_path(path)
+    if not os.path.exists(path) or not os.path.exists(validators_path):
+        return {}
+    with open(validators_path, "r") as f:
+        return json.load(f)
+
+
+def write_validators(path: str | Path, response: Response):
+    validators = {}
+    for header in validator_headers:
+        value = response.headers.get(header)
+        if value is not None:
+            validators[header] = value
+    with open(get_validators_path(path), "w") as f:
+        json.dump(validators, f)
+
+
+def get_conditional_headers(validators: dict) -> dict:
+    headers = {}
+    if "ETag" in validators:
+        headers["If-None-Match"] = validators["ETag"]
+    if "Last-Modified" in validators:
+        headers["If-Modified-Since"] = validators["Last-Modified"]
+    return headers
+
+
+def get_resume_headers(partial_path: Path) -> dict:
+    if not os.path.exists(partial_path):
+        return {}
+    offset = os.path.getsize(partial_path)
+    validators = read_validators(partial_path)
+    # without a validator there is no way to tell the server which version of
+    # the file the partial download came from
+    validator = validators.get("ETag", validators.get("Last-Modified"))
+    if offset == 0 or validator is None:
+        return {}
+    return {"Range": f"bytes={offset}-", "If-Range": validator}
+
+
+def download_binary(
+    url: str, path: str | Path, credentials: Optional[Credentials] = None
+) -> bool:
+    partial_path = get_partial_path(path)
+    headers = get_conditional_headers(read_validators(path))
+    headers.update(get_resume_headers(partial_path))
+    response = make_request(url, credentials=credentials, stream=True, headers=headers)
+    if response.status_code == 304:
+        print(f"{path} is up to date")
+        return False
+    if response.status_code == 206:
+        mode = "ab"
+    elif response.status_code == 200:
+        # the server sends the whole file if it has changed since the partial
+        # download started or it does not support ranges
+        mode = "wb"
+        write_validators(partial_path, response)
+    else:
         raise RuntimeError(f"Could not get {url}")
-    with open(path, "wb+") as f:
-        f.write(response.raw.read())
+    with open(partial_path, mode) as f:
+        for chunk in response.iter_content(chunk_size=download_chunk_size):
+            f.write(chunk)
+    os.replace(partial_path, path)
+    os.replace(get_validators_path(partial_path), get_validators_path(path))
+    return True
 
 
 def prefix_namespace(namespace: str, tag: str) -> str:
     return f"{{{namespace}}}{tag}"
 
 
-def get_tag_text(root: ET.Element, tag: str, namespace: Optional[str] = None) -> str:
-    if namespace is not None:
-        tag = prefix_namespace(namespace, tag)
-    content: Any = get_or_throw(root.find(tag))
-    return get_or_throw(content.text)
+# anything the parser can read bytes from, such as a file or the raw body of a
+# streamed response
+class ByteSource(Protocol):
+    def read(self, size: int = -1, /) -> bytes:
+        ...
+
+
+# yields the text of the wanted direct children of each record element as the
+# document is read, clearing each record once it has been seen so that only
+# one is ever held in memory
+def read_xml_records(
+    source: ByteSource, namespace: str, record_tag: str, fields: list[str]
+) -> Iterator[dict[str, Optional[str]]]:
+    record = prefix_namespace(namespace, record_tag)
+    wanted = {prefix_namespace(namespace, field): field for field in fields}
+    root = None
+    depth = 0
+    record_depth = None
+    values: dict[str, Optional[str]] = {}
+    for event, element in ET.iterparse(source, events=("start", "end")):
+        if event == "start":
+            depth = depth + 1
+            if root is None:
+                root = element
+            if record_depth is None and element.tag == record:
+                record_depth = depth
+                values = {}
+            continue
+        if record_depth is not None:
+            if depth == record_depth + 1 and element.tag in wanted:
+                values[wanted[element.tag]] = element.text
+            elif depth == record_depth:
+                yield values
+                record_depth = None
+                get_or_throw(root).clear()
+        depth = depth - 1
 
 
 def make_request(
@@ -65,7 +171,22 @@ def make_request(
     else:
         auth = None
     print(f"Making request to {url}")
-    return requests.get(url, auth=auth, stream=stream, headers=headers)
+    return get_client().get(url, auth=auth, stream=stream, headers=headers)
+
+
+def get_xml_records(
+    url: str,
+    namespace: str,
+    record_tag: str,
+    fields: list[str],
+    headers: Optional[dict] = None,
+) -> Iterator[dict[str, Optional[str]]]:
+    with make_request(url, stream=True, headers=headers) as response:
+        if response.status_code != 200:
+            raise RuntimeError(f"Could not get {url}")
+        # undo any content encoding while streaming the body to the parser
+        response.raw.decode_content = True
+        yield from read_xml_records(response.raw, namespace, record_tag, fields)
 
 
 def get_json(
@@ -83,7 +204,7 @@ def make_post_request(
     url: str, headers: Optional[dict] = None, data: Optional[dict] = None
 ) -> Response:
     print(f"Making post request to {url}")
-    return requests.post(url, headers=headers, data=data)
+    return get_client().post(url, headers=headers, data=data)
 
 
 def get_post_json(
@@ -0,0 +1,62 @@
+from dataclasses import dataclass
+from threading import Event, Lock
+from typing import Callable, Generic, Hashable, Optional, TypeVar
+
+V = TypeVar("V")
+
+
+@dataclass
+class FlightStats:
+    in_flight: int
+    calls: int
+    coalesced: int
+
+
+class Flight(Generic[V]):
+    def __init__(self):
+        self.done = Event()
+        self.value: Optional[V] = None
+        self.error: Optional[BaseException] = None
+
+
+# Coalesces concurrent calls with the same key, so that while one thread is
+# running the call for a key any other thread asking for it waits for and
+# shares that result instead of making the call again. Nothing is kept once
+# the call returns; caching results is left to the caller.
+class SingleFlight(Generic[V]):
+    def __init__(self):
+        self.flights: dict[Hashable, Flight[V]] = {}
+        self.lock = Lock()
+        self.calls = 0
+        self.coalesced = 0
+
+    def do(self, key: Hashable, fn: Callable[[], V]) -> V:
+        with self.lock:
+            flight = self.flights.get(key)
+            if flight is None:
+                flight = Flight()
+                self.flights[key] = flight
+                self.calls = self.calls + 1
+                leader = True
+            else:
+                self.coalesced = self.coalesced + 1
+                leader = False
+        if not leader:
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.value  # type: ignore
+        try:
+            flight.value = fn()
+        except BaseException as e:
+            flight.error = e
+            raise
+        finally:
+            with self.lock:
+                del self.flights[key]
+            flight.done.set()
+        return flight.value
+
+    def stats(self) -> FlightStats:
+        with self.lock:
+            return FlightStats(len(self.flights), self.calls, self.coalesced)
@@ -1,12 +1,19 @@
+import gzip
+import json
+
+from json import JSONDecodeError
+from pathlib import Path
+from typing import Any, Iterator, Optional, TextIO
+
 from credentials import Credentials
 
 from pull.core import (
     data_directory,
     download_binary,
-    extract_gz,
     get_or_throw,
     get_post_json,
 )
+from structs.network import CorpusLocation, NetworkLink, TimingPoint
 
 ################################################################################
 #
@@ -56,7 +63,7 @@ def get_natrail_token_headers(natrail_token: str) -> dict:
 #
 ################################################################################
 
-corpus_path = data_directory / "corpus.json"
+corpus_path = data_directory / "corpus.json.gz"
 
 
 def get_corpus_data_url() -> str:
@@ -65,9 +72,72 @@ def get_corpus_data_url() -> str:
 
 def download_corpus(corpus_credentials: Credentials):
     corpus_url = get_corpus_data_url()
-    corpus_download_path = "data/corpus.gz"
-    download_binary(corpus_url, corpus_download_path, credentials=corpus_credentials)
-    extract_gz(corpus_download_path, corpus_path)
+    download_binary(corpus_url, corpus_path, credentials=corpus_credentials)
+
+
+# characters decompressed from the file at a time while looking for the end of
+# the next object
+corpus_chunk_size = 64 * 1024
+
+
+# yields each element of the first array in a json document, holding only the
+# element being decoded in memory rather than the whole document
+def read_json_array(f: TextIO, chunk_size: int = corpus_chunk_size) -> Iterator[Any]:
+    decoder = json.JSONDecoder()
+    buffer = ""
+    while "[" not in buffer:
+        chunk = f.read(chunk_size)
+        if chunk == "":
+            return
+        buffer = buffer + chunk
+    buffer = buffer[buffer.index("[") + 1 :]
+    position = 0
+    while True:
+        while position < len(buffer) and buffer[position] in " \t\r\n,":
+            position = position + 1
+        if position < len(buffer) and buffer[position] == "]":
+            return
+        try:
+            (element, position) = decoder.raw_decode(buffer, position)
+        except JSONDecodeError:
+            # the element runs past the end of what has been read so far
+            chunk = f.read(chunk_size)
+            if chunk == "":
+                raise
+            buffer = buffer[position:] + chunk
+            position = 0
+            continue
+        yield element
+
+
+def get_corpus_value(json: dict, key: str) -> Optional[str]:
+    value = json.get(key)
+    if value is None:
+        return None
+    # missing codes are given as a single space
+    value = str(value).strip()
+    if value == "":
+        return None
+    return value
+
+
+def make_corpus_location(json: dict) -> CorpusLocation:
+    return CorpusLocation(
+        get_corpus_value(json, "TIPLOC"),
+        get_corpus_value(json, "STANOX"),
+        get_corpus_value(json, "3ALPHA"),
+        get_corpus_value(json, "NLC"),
+        get_corpus_value(json, "UIC"),
+        get_corpus_value(json, "NLCDESC"),
+        get_corpus_value(json, "NLCDESC16"),
+    )
+
+
+def read_corpus(path: str | Path = corpus_path) -> Iterator[CorpusLocation]:
+    with gzip.open(path, "rt", encoding="utf-8") as f:
+        # the file is a single object holding the TIPLOCDATA array
+        for entry in read_json_array(f):
+            yield make_corpus_location(entry)
 
 
 ################################################################################
@@ -79,7 +149,7 @@ def download_corpus(corpus_credentials: Credentials):
 #
 ################################################################################
 
-bplan_path = data_directory / "bplan.tsv"
+bplan_path = data_directory / "bplan.tsv.gz"
 
 
 def get_bplan_data_url() -> str:
@@ -88,6 +158,75 @@ def get_bplan_data_url() -> str:
 
 def download_bplan():
     bplan_url = get_bplan_data_url()
-    bplan_download_path = "data/bplan.gz"
-    download_binary(bplan_url, bplan_download_path)
-    extract_gz(bplan_download_path, bplan_path)
+    download_binary(bplan_url, bplan_path)
+
+
+def read_bplan_records(
+    record_type: str, path: str | Path = bplan_path
+) -> Iterator[list[str]]:
+    # bplan is exported from a windows system and is not valid utf-8
+    with gzip.open(path, "rt", encoding="latin-1") as f:
+        for line in f:
+            if not line.startswith(record_type):
+                continue
+            row = line.rstrip("\r\n").split("\t")
+            if row[0] == record_type:
+                yield row
+
+
+def get_bplan_value(row: list[str], column: int) -> Optional[str]:
+    if column >= len(row):
+        return None
+    value = row[column].strip()
+    if value == "":
+        return None
+    return value
+
+
+def get_bplan_int(row: list[str], column: int) -> Optional[int]:
+    value = get_bplan_value(row, column)
+    if value is None:
+        return None
+    return int(value)
+
+
+# LOC columns
+loc_tiploc = 2
+loc_name = 3
+loc_easting = 6
+loc_northing = 7
+loc_stanox = 10
+
+
+def make_timing_point(row: list[str]) -> TimingPoint:
+    return TimingPoint(
+        row[loc_tiploc],
+        row[loc_name],
+        get_bplan_int(row, loc_easting),
+        get_bplan_int(row, loc_northing),
+        get_bplan_value(row, loc_stanox),
+    )
+
+
+def read_bplan_timing_points(path: str | Path = bplan_path) -> Iterator[TimingPoint]:
+    return map(make_timing_point, read_bplan_records("LOC", path))
+
+
+# NWK columns
+nwk_origin = 2
+nwk_destination = 3
+nwk_line = 4
+nwk_distance = 10
+
+
+def make_network_link(row: list[str]) -> NetworkLink:
+    return NetworkLink(
+        row[nwk_origin],
+        row[nwk_destination],
+        get_bplan_value(row, nwk_line),
+        get_bplan_int(row, nwk_distance),
+    )
+
+
+def read_bplan_network_links(path: str | Path = bplan_path) -> Iterator[NetworkLink]:
+    return map(make_network_link, read_bplan_records("NWK", path))
@@ -0,0 +1,126 @@
+import hashlib
+
+from threading import Lock
+from typing import Any, Hashable, Optional
+
+from dotenv import dotenv_values
+from fastapi import Response
+from pydantic import TypeAdapter
+
+from pull.cache import CacheStats, LruCache
+
+################################################################################
+#
+# Serialisation
+#
+# FastAPI validates whatever a handler returns against its response model and
+# only then encodes it, so a long service has every nested stop walked twice.
+# Handlers that already hold a value of the right type return it encoded by a
+# type adapter built once per type instead, and FastAPI passes the response
+# through untouched. Responses that cannot change are kept as encoded bytes
+# and served straight from memory.
+#
+# Every encoded response carries a strong ETag taken from its content, so that
+# clients can revalidate what they already hold, and a Cache-Control header
+# saying how long they can hold it without asking. A compressed response is a
+# different representation, so its ETag has the content coding added to it.
+#
+################################################################################
+
+# must be revalidated before each use
+no_cache = "no-cache"
+# reference data only changes when it is reloaded, which is rare
+reference_cache_control = "public, max-age=3600"
+# services that have finished running
+immutable_cache_control = "public, max-age=31536000, immutable"
+
+
+def get_etag(content: bytes) -> str:
+    return f'"{hashlib.md5(content).hexdigest()}"'
+
+
+# "abc" sent as gzip becomes "abc-gzip"
+def get_encoded_etag(etag: str, coding: str) -> str:
+    return f'{etag[:-1]}-{coding}"'
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    if if_none_match is None:
+        return False
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        # If-None-Match uses the weak comparison, so W/ prefixes are ignored
+        if candidate.startswith("W/"):
+            candidate = candidate[2:]
+        if candidate == "*" or candidate == etag:
+            return True
+    return False
+
+
+class EncodedJSONResponse(Response):
+    media_type = "application/json"
+
+    def __init__(self, content: bytes, cache_control: str = no_cache, **kwargs):
+        super().__init__(content, **kwargs)
+        self.headers["ETag"] = get_etag(content)
+        self.headers["Cache-Control"] = cache_control
+
+
+type_adapters: dict[Any, TypeAdapter] = {}
+type_adapters_lock = Lock()
+
+
+def get_type_adapter(model_type: Any) -> TypeAdapter:
+    adapter = type_adapters.get(model_type)
+    if adapter is None:
+        with type_adapters_lock:
+            adapter = type_adapters.get(model_type)
+            if adapter is None:
+                adapter = TypeAdapter(model_type)
+                type_adapters[model_type] = adapter
+    return adapter
+
+
+def encode(model_type: Any, value: Any) -> bytes:
+    return get_type_adapter(model_type).dump_json(value)
+
+
+def encoded_response(
+    model_type: Any, value: Any, cache_control: str = no_cache
+) -> EncodedJSONResponse:
+    return EncodedJSONResponse(encode(model_type, value), cache_control)
+
+
+response_env_values = dotenv_values()
+response_cache_size = int(response_env_values.get("RESPONSE_CACHE_SIZE") or 4096)
+
+# keeps the content alongside the cache control it is served with
+response_cache: LruCache[tuple[bytes, str]] = LruCache(response_cache_size)
+
+
+def get_cached_response(key: Hashable) -> Optional[EncodedJSONResponse]:
+    entry = response_cache.get(key)
+    if entry is None:
+        return None
+    (content, cache_control) = entry
+    return EncodedJSONResponse(content, cache_control)
+
+
+def cache_response(
+    key: Hashable,
+    model_type: Any,
+    value: Any,
+    cache_control: str = reference_cache_control,
+    ttl: Optional[float] = None,
+) -> EncodedJSONResponse:
+    content = encode(model_type, value)
+    response_cache.put(key, (content, cache_control), ttl)
+    return EncodedJSONResponse(content, cache_control)
+
+
+def clear_response_cache():
+    response_cache.clear()
+
+
+def get_response_cache_stats() -> CacheStats:
+    return response_cache.stats()
@@ -1,8 +1,13 @@
 from dataclasses import dataclass
 from typing import Optional
 
-from database.methods import select
-from database.schema import bus_stop_table, colour_table
+from database.methods import escape_like, named_query, select, select_query
+from database.schema import (
+    bus_stop_search_text,
+    bus_stop_search_words,
+    bus_stop_table,
+    bus_stop_word_table,
+)
 
 
 @dataclass
@@ -20,22 +25,42 @@ class BusStop:
     lon: float
 
 
+bus_stop_fields = [
+    "atco",
+    "naptan",
+    "name",
+    "parent_locality",
+    "locality",
+    "landmark",
+    "street",
+    "indicator",
+    "bearing",
+    "lat",
+    "lon",
+]
+
+
+def make_bus_stop(row: tuple) -> BusStop:
+    return BusStop(
+        row[0],
+        row[1],
+        row[2],
+        row[3],
+        row[4],
+        row[5],
+        row[6],
+        row[7],
+        row[8],
+        row[9],
+        row[10],
+    )
+
+
+@named_query
 def select_bus_stop(cur, atco: str) -> BusStop:
     rows = select(
         cur,
-        [
-            "atco",
-            "naptan",
-            "name",
-            "parent_locality",
-            "locality",
-            "landmark",
-            "street",
-            "indicator",
-            "bearing",
-            "lat",
-            "lon",
-        ],
+        bus_stop_fields,
         bus_stop_table,
         ["atco = %(atco)s"],
         {"atco": atco},
@@ -43,38 +68,113 @@ def select_bus_stop(cur, atco: str) -> BusStop:
     if len(rows) != 1:
         raise RuntimeError(f"No match for atco {atco}")
     else:
-        row = rows[0]
-        return BusStop(
-            row[0],
-            row[1],
-            row[2],
-            row[3],
-            row[4],
-            row[5],
-            row[6],
-            row[7],
-            row[8],
-            row[9],
-            row[10],
+        return make_bus_stop(rows[0])
+
+
+@named_query
+def select_bus_stops(cur, atcos: list[str]) -> list[BusStop]:
+    rows = select(
+        cur,
+        bus_stop_fields,
+        bus_stop_table,
+        ["atco = ANY(%(atcos)s)"],
+        {"atcos": atcos},
+    )
+    return list(map(make_bus_stop, rows))
+
+
+# similar words with less in common than this are not worth suggesting
+min_word_similarity = 0.25
+# how many similar words to try in place of each word of the query
+similar_word_count = 3
+# how many stops containing the words of the query are ranked, as common words
+# can be in tens of thousands of stops
+word_match_limit = 100
+
+
+# Stops whose text starts with the query come first, found in order from the
+# prefix index. After them come stops that contain every word of the query, or
+# a word starting with it, or one of the words in any stop most similar to it,
+# so that misspellings are corrected against the few thousand distinct words
+# rather than every stop.
+@named_query
+def search_bus_stops(cur, query: str, limit: int) -> list[BusStop]:
+    statement = f"""
+        WITH query_words AS (
+            SELECT unnest(tsvector_to_array(to_tsvector('simple', %(query)s)))
+            AS word
+        ),
+        terms AS (
+            SELECT
+                '(' || quote_literal(query_words.word) || ':*'
+                || COALESCE(
+                    ' | ' || string_agg(quote_literal(similar_words.word), ' | '),
+                    ''
+                )
+                || ')' AS term
+            FROM query_words
+            LEFT JOIN LATERAL (
+                SELECT word FROM (
+                    SELECT word, word <-> query_words.word AS distance
+                    FROM {bus_stop_word_table}
+                    ORDER BY distance
+                    LIMIT %(similar_word_count)s
+                ) AS nearest
+                WHERE distance <= 1 - %(min_word_similarity)s
+            ) AS similar_words ON true
+            GROUP BY query_words.word
+        ),
+        matches AS (
+            (
+                SELECT atco, 0 AS rank FROM {bus_stop_table}
+                WHERE {bus_stop_search_text} COLLATE "C" LIKE %(prefix)s
+                ORDER BY {bus_stop_search_text} COLLATE "C"
+                LIMIT %(limit)s
+            )
+            UNION ALL
+            (
+                SELECT atco, 1 AS rank FROM {bus_stop_table}
+                WHERE {bus_stop_search_words} @@ (
+                    SELECT to_tsquery('simple', string_agg(term, ' & ')) FROM terms
+                )
+                LIMIT %(word_match_limit)s
+            )
         )
+        SELECT {", ".join(bus_stop_fields)}
+        FROM {bus_stop_table}
+        INNER JOIN (
+            SELECT atco, MIN(rank) AS rank FROM matches GROUP BY atco
+        ) AS ranked
+        USING (atco)
+        ORDER BY
+            ranked.rank,
+            word_similarity(%(query)s, {bus_stop_search_text}) DESC,
+            name
+        LIMIT %(limit)s
+    """
+    query = query.lower()
+    rows = select_query(
+        cur,
+        statement,
+        {
+            "query": query,
+            "prefix": f"{escape_like(query)}%",
+            "limit": limit,
+            "similar_word_count": similar_word_count,
+            "min_word_similarity": min_word_similarity,
+            "word_match_limit": word_match_limit,
+        },
+    )
+    return list(map(make_bus_stop, rows))
+
+
+@dataclass
+class NearbyBusStop:
+    stop: BusStop
+    distance: float
 
 
 @dataclass
 class BusRoute:
     fg: str
     bg: str
-
-
-def select_bus_route(cur, slug: str) -> BusRoute:
-    rows = select(
-        cur,
-        ["fg", "bg"],
-        colour_table,
-        ["type=%(type)s", "code=%(slug)s"],
-        {"type": "bus", "slug": slug},
-    )
-    if len(rows) != 1:
-        raise RuntimeError(f"No match for slug {slug}")
-    else:
-        row = rows[0]
-        return BusRoute(row[0], row[1])
@@ -0,0 +1,31 @@
+from dataclasses import dataclass
+from typing import Optional
+
+
+@dataclass
+class CorpusLocation:
+    tiploc: Optional[str]
+    stanox: Optional[str]
+    crs: Optional[str]
+    nlc: Optional[str]
+    uic: Optional[str]
+    name: Optional[str]
+    short_name: Optional[str]
+
+
+@dataclass
+class TimingPoint:
+    tiploc: str
+    name: str
+    easting: Optional[int]
+    northing: Optional[int]
+    stanox: Optional[str]
+
+
+@dataclass
+class NetworkLink:
+    origin: str
+    destination: str
+    line: Optional[str]
+    # metres
+    distance: Optional[int]
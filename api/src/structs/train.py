@@ -1,6 +1,8 @@
 from re import S
-from typing import Optional
-import xml.etree.ElementTree as ET
+from dataclasses import dataclass as plain_dataclass
+from threading import Lock
+from collections import ChainMap
+from typing import Iterator, Mapping, MutableMapping, Optional
 
 import arrow
 from fastapi import HTTPException
@@ -8,17 +10,16 @@ from pydantic import BaseModel, ConfigDict, validator
 from pydantic.dataclasses import dataclass
 
 from arrow import Arrow
+from dotenv import dotenv_values
+from psycopg2.extras import Json
 from credentials import Credentials
-from database.methods import select, select_query
+from database.methods import execute, escape_like, named_query, select, select_query
+from database.pool import run_with_cursor
 from pull import train
 
-from pull.core import (
-    get_json,
-    get_or_throw,
-    get_tag_text,
-    make_request,
-    prefix_namespace,
-)
+from pull.cache import CacheStats, LruCache
+from pull.flight import FlightStats, SingleFlight
+from pull.core import get_json, get_or_throw, get_xml_records
 from pull.train import (
     get_kb_url,
     get_natrail_token_headers,
@@ -35,19 +36,20 @@ class Toc:
     atoc: str
 
 
-def pull_tocs(natrail_token: str) -> list[Toc]:
+def pull_tocs(natrail_token: str) -> Iterator[Toc]:
     kb_tocs_url = get_kb_url("tocs")
     headers = get_natrail_token_headers(natrail_token)
-    kb_tocs = make_request(kb_tocs_url, headers=headers).text
-    kb_tocs_xml = ET.fromstring(kb_tocs)
-    tocs = []
-    for toc in kb_tocs_xml.findall(
-        prefix_namespace(kb_tocs_namespace, "TrainOperatingCompany")
-    ):
-        toc_name = get_tag_text(toc, "Name", kb_tocs_namespace)
-        toc_code = get_tag_text(toc, "AtocCode", kb_tocs_namespace)
-        tocs.append(Toc(toc_name, toc_code))
-    return tocs
+    records = get_xml_records(
+        kb_tocs_url,
+        kb_tocs_namespace,
+        "TrainOperatingCompany",
+        ["Name", "AtocCode"],
+        headers=headers,
+    )
+    for record in records:
+        toc_name = get_or_throw(record.get("Name"))
+        toc_code = get_or_throw(record.get("AtocCode"))
+        yield Toc(toc_name, toc_code)
 
 
 @dataclass
@@ -76,40 +78,6 @@ class TocData:
         return TocDataSlimline(self.name, self.atoc, self.fg, self.bg)
 
 
-def select_brands(cur, atoc: str) -> list[Brand]:
-    rows = select(
-        cur,
-        ["atoc", "endpoints"],
-        brand_table,
-        ["parent = %(parent)s"],
-        {"parent": atoc},
-    )
-    return list(map(lambda row: Brand(row[0], row[1]), rows))
-
-
-def select_toc(cur, descriptor: str) -> Optional[TocData]:
-    rows = select(
-        cur,
-        ["toc.name", "toc.atoc", "colour.fg", "colour.bg"],
-        f"{toc_table} LEFT OUTER JOIN {colour_table} ON toc.atoc = colour.code",
-        ["atoc = %(descriptor)s or name = %(descriptor)s"],
-        {"descriptor": descriptor},
-    )
-    if len(rows) != 1:
-        return None
-    else:
-        row = rows[0]
-        brands = select_brands(cur, row[1])
-        return TocData(row[0], row[1], row[2], row[3], brands)
-
-
-def select_toc_slimline(cur, descriptor: str) -> Optional[TocDataSlimline]:
-    toc = select_toc(cur, descriptor)
-    if toc is None:
-        return None
-    return TocDataSlimline(toc.name, toc.atoc, toc.fg, toc.bg)
-
-
 @dataclass
 class TrainStation:
     name: str
@@ -119,25 +87,28 @@ class TrainStation:
     operator: str
 
 
-def pull_stations(natrail_token: str) -> list[TrainStation]:
+kb_station_fields = ["Name", "CrsCode", "Latitude", "Longitude", "StationOperator"]
+
+
+def pull_stations(natrail_token: str) -> Iterator[TrainStation]:
     kb_stations_url = get_kb_url("stations")
     headers = get_natrail_token_headers(natrail_token)
-    kb_stations = make_request(kb_stations_url, headers=headers).text
-    kb_stations_xml = ET.fromstring(kb_stations)
-    stations = []
-    for stn in kb_stations_xml.findall(
-        prefix_namespace(kb_stations_namespace, "Station")
-    ):
-        station_name = get_tag_text(stn, "Name", kb_stations_namespace)
-        station_crs = get_tag_text(stn, "CrsCode", kb_stations_namespace)
-        station_lat = float(get_tag_text(stn, "Latitude", kb_stations_namespace))
-        station_lon = float(get_tag_text(stn, "Longitude", kb_stations_namespace))
-        station_operator = get_tag_text(stn, "StationOperator", kb_stations_namespace)
-        station = TrainStation(
+    records = get_xml_records(
+        kb_stations_url,
+        kb_stations_namespace,
+        "Station",
+        kb_station_fields,
+        headers=headers,
+    )
+    for record in records:
+        station_name = get_or_throw(record.get("Name"))
+        station_crs = get_or_throw(record.get("CrsCode"))
+        station_lat = float(get_or_throw(record.get("Latitude")))
+        station_lon = float(get_or_throw(record.get("Longitude")))
+        station_operator = get_or_throw(record.get("StationOperator"))
+        yield TrainStation(
             station_name, station_crs, station_lat, station_lon, station_operator
         )
-        stations.append(station)
-    return stations
 
 
 @dataclass
@@ -158,48 +129,49 @@ class TrainStationDataSlimline:
     operator: TocDataSlimline
 
 
-def select_train_station(cur, descriptor: str) -> Optional[TrainStationDataSlimline]:
+@named_query
+def search_train_stations(cur, query: str, limit: int) -> list[str]:
     statement = f"""
-        SELECT
-            {train_station_table}.name,
-            {train_station_table}.crs,
-            {train_station_table}.lat,
-            {train_station_table}.lon,
-            {toc_table}.name AS operator_name,
-            {toc_table}.atoc AS operator_atoc,
-            {colour_table}.fg,
-            {colour_table}.bg
-        FROM
-            {train_station_table}
-        INNER JOIN
-            {toc_table}
-        ON
-            {train_station_table}.operator = {toc_table}.atoc
-        INNER JOIN
-            {colour_table}
-        ON
-            {toc_table}.atoc = {colour_table}.code
+        SELECT crs
+        FROM {train_station_table}
         WHERE
-            {train_station_table}.name = %(descriptor)s
+            %(query)s <%% {train_station_search_text}
             OR
-            {train_station_table}.crs = %(descriptor)s
+            {train_station_search_text} LIKE %(substring)s
+        ORDER BY
+            {train_station_search_text} LIKE %(prefix)s DESC,
+            word_similarity(%(query)s, {train_station_search_text}) DESC,
+            name
+        LIMIT %(limit)s
     """
+    query = query.lower()
     rows = select_query(
         cur,
         statement,
-        {"descriptor": descriptor},
+        {
+            "query": query,
+            "substring": f"%{escape_like(query)}%",
+            "prefix": f"{escape_like(query)}%",
+            "limit": limit,
+        },
+    )
+    return list(map(lambda row: row[0], rows))
+
+
+@dataclass
+class NearbyTrainStation:
+    station: TrainStationDataSlimline
+    distance: float
+
+
+def make_station_slimline(row: tuple) -> TrainStationDataSlimline:
+    return TrainStationDataSlimline(
+        row[0],
+        row[1],
+        row[2],
+        row[3],
+        TocDataSlimline(row[4], row[5], row[6], row[7]),
     )
-    if len(rows) != 1:
-        return None
-    else:
-        row = rows[0]
-        return TrainStationDataSlimline(
-            row[0],
-            row[1],
-            row[2],
-            row[3],
-            TocDataSlimline(row[4], row[5], row[6], row[7]),
-        )
 
 
 @dataclass(config=dict(arbitrary_types_allowed=True))
@@ -226,10 +198,329 @@ def get_train_service_api_endpoint(id: str, run_date: Arrow) -> str:
     return f"https://api.rtt.io/api/v1/json/service/{id}/{date_string}"
 
 
-def get_endpoint_stations(cur, endpoints: list[dict]) -> list[TrainStationDataSlimline]:
+################################################################################
+#
+# RTT service cache
+#
+# Responses from RTT are cached in memory and in the database. A service can run
+# past midnight, but once the day after it ran has passed it can no longer
+# change, so responses fetched after that point are kept indefinitely. Other
+# responses are refetched once they are older than the time to live.
+#
+################################################################################
+
+rtt_env_values = dotenv_values()
+rtt_cache_ttl = int(rtt_env_values.get("RTT_CACHE_TTL") or 300)
+rtt_cache_size = int(rtt_env_values.get("RTT_CACHE_SIZE") or 1024)
+rtt_timezone = "Europe/London"
+
+rtt_service_cache: LruCache[dict] = LruCache(rtt_cache_size)
+# requests for a service that is already being loaded wait for that load
+rtt_service_flights: SingleFlight[Optional[dict]] = SingleFlight()
+
+
+@plain_dataclass
+class RttCacheCounters:
+    database_hits: int = 0
+    upstream_fetches: int = 0
+
+
+rtt_cache_counters = RttCacheCounters()
+rtt_cache_counters_lock = Lock()
+
+
+@dataclass
+class RttCacheStats:
+    memory: CacheStats
+    flights: FlightStats
+    database_hits: int
+    upstream_fetches: int
+
+
+def get_rtt_cache_stats() -> RttCacheStats:
+    with rtt_cache_counters_lock:
+        return RttCacheStats(
+            rtt_service_cache.stats(),
+            rtt_service_flights.stats(),
+            rtt_cache_counters.database_hits,
+            rtt_cache_counters.upstream_fetches,
+        )
+
+
+def is_final_response(run_date: Arrow, fetched: Arrow) -> bool:
+    fetched_date = fetched.to(rtt_timezone).date()
+    return fetched_date > run_date.shift(days=1).date()
+
+
+def get_service_ttl(run_date: Arrow, fetched: Arrow) -> Optional[float]:
+    if is_final_response(run_date, fetched):
+        return None
+    age = (arrow.now(rtt_timezone) - fetched).total_seconds()
+    return rtt_cache_ttl - age
+
+
+def is_service_complete(run_date: Arrow) -> bool:
+    # a response that is not final is only served until it is older than the
+    # time to live, so if one fetched that long ago would be final then every
+    # response that can still be served for the service is
+    oldest_served = arrow.now(rtt_timezone).shift(seconds=-rtt_cache_ttl)
+    return is_final_response(run_date, oldest_served)
+
+
+@named_query
+def select_cached_service_json(
+    cur, id: str, run_date: Arrow
+) -> Optional[tuple[dict, Arrow]]:
+    rows = select(
+        cur,
+        ["response", "fetched"],
+        rtt_service_table,
+        ["service_id = %(id)s", "run_date = %(run_date)s"],
+        {"id": id, "run_date": run_date.date()},
+    )
+    if len(rows) != 1:
+        return None
+    row = rows[0]
+    return (row[0], arrow.get(row[1]))
+
+
+@named_query
+def upsert_cached_service_json(
+    cur, id: str, run_date: Arrow, json: dict, fetched: Arrow
+):
+    statement = f"""
+        INSERT INTO {rtt_service_table} (service_id, run_date, response, fetched)
+        VALUES (%(id)s, %(run_date)s, %(response)s, %(fetched)s)
+        ON CONFLICT (service_id, run_date) DO UPDATE
+        SET response = EXCLUDED.response, fetched = EXCLUDED.fetched
+    """
+    execute(
+        cur,
+        statement,
+        {
+            "id": id,
+            "run_date": run_date.date(),
+            "response": Json(json),
+            "fetched": fetched.datetime,
+        },
+    )
+    cur.connection.commit()
+
+
+def is_valid_service_json(json: Optional[dict]) -> bool:
+    return json is not None and json.get("error") is None
+
+
+# The connection is only checked out for the lookup in the database and for
+# storing what was fetched, never while waiting on RTT, which with its rate
+# limit and retries can take far longer than any query
+def load_service_json(
+    id: str, run_date: Arrow, rtt_credentials: Credentials, key: tuple
+) -> Optional[dict]:
+    cached = run_with_cursor(select_cached_service_json, id, run_date)
+    if cached is not None:
+        (cached_json, cached_fetched) = cached
+        ttl = get_service_ttl(run_date, cached_fetched)
+        if ttl is None or ttl > 0:
+            with rtt_cache_counters_lock:
+                rtt_cache_counters.database_hits = rtt_cache_counters.database_hits + 1
+            rtt_service_cache.put(key, cached_json, ttl)
+            return cached_json
+    with rtt_cache_counters_lock:
+        rtt_cache_counters.upstream_fetches = rtt_cache_counters.upstream_fetches + 1
+    endpoint = get_train_service_api_endpoint(id, run_date)
+    fetched = arrow.now(rtt_timezone)
+    fetched_json = get_json(endpoint, credentials=rtt_credentials)
+    # errors are not cached, as they may be caused by a transient upstream fault
+    if fetched_json is None or not is_valid_service_json(fetched_json):
+        return fetched_json
+    run_with_cursor(upsert_cached_service_json, id, run_date, fetched_json, fetched)
+    rtt_service_cache.put(key, fetched_json, get_service_ttl(run_date, fetched))
+    return fetched_json
+
+
+def get_service_json(
+    id: str, run_date: Arrow, rtt_credentials: Credentials
+) -> Optional[dict]:
+    key = (id, run_date.format("YYYY-MM-DD"))
+    json = rtt_service_cache.get(key)
+    if json is not None:
+        return json
+    return rtt_service_flights.do(
+        key, lambda: load_service_json(id, run_date, rtt_credentials, key)
+    )
+
+
+def get_station_descriptors(json: dict) -> list[str]:
+    calls = filter(lambda loc: loc["isCall"], json["locations"])
+    return (
+        list(map(lambda point: point["description"], json["origin"]))
+        + list(map(lambda point: point["description"], json["destination"]))
+        + list(map(lambda call: call["crs"], calls))
+    )
+
+
+# The stations and tocs needed to build one or more services, so that a batch
+# of services can share a single pass over the database
+@plain_dataclass
+class ServiceLookups:
+    stations: MutableMapping[str, TrainStationDataSlimline]
+    tocs: MutableMapping[str, TocData]
+    # the brand to report for a service run by a toc with brands, keyed by the
+    # atoc of the parent toc and the name of an origin or destination
+    brands: MutableMapping[tuple[str, str], TocDataSlimline]
+
+
+def make_brand_lookups(
+    tocs: Mapping[str, TocData]
+) -> dict[tuple[str, str], TocDataSlimline]:
+    brands: dict[tuple[str, str], TocDataSlimline] = {}
+    for key, toc in tocs.items():
+        # tocs are keyed by name as well as atoc
+        if key != toc.atoc:
+            continue
+        for brand in toc.brands:
+            brand_toc = tocs.get(brand.atoc)
+            if brand_toc is None:
+                continue
+            brand_slimline = brand_toc.to_slimline()
+            for endpoint in brand.endpoints:
+                # earlier brands take precedence if an endpoint is shared
+                brands.setdefault((toc.atoc, endpoint), brand_slimline)
+    return brands
+
+
+@named_query
+def select_service_lookups(
+    cur, descriptors: list[str], operators: list[str]
+) -> ServiceLookups:
+    # stations, tocs and brands are each aggregated into a json array so that
+    # they can all be fetched in a single round trip. As when the reference
+    # index is loaded, tocs without colours and brands without endpoints are
+    # left out rather than failing the whole lookup
+    statement = f"""
+        WITH operators AS (
+            SELECT atoc FROM {toc_table}
+            WHERE atoc = ANY(%(operators)s) OR name = ANY(%(operators)s)
+        ),
+        brands AS (
+            SELECT parent, atoc, endpoints FROM {brand_table}
+            WHERE
+                parent IN (SELECT atoc FROM operators)
+                AND
+                endpoints IS NOT NULL
+        )
+        SELECT
+            (
+                SELECT COALESCE(json_agg(json_build_array(
+                    station.name,
+                    station.crs,
+                    station.lat,
+                    station.lon,
+                    toc.name,
+                    toc.atoc,
+                    colour.fg,
+                    colour.bg
+                )), '[]')
+                FROM
+                    {train_station_table} AS station
+                INNER JOIN
+                    {toc_table} AS toc
+                ON
+                    station.operator = toc.atoc
+                INNER JOIN
+                    {colour_table} AS colour
+                ON
+                    toc.atoc = colour.code
+                WHERE
+                    (
+                        station.name = ANY(%(descriptors)s)
+                        OR
+                        station.crs = ANY(%(descriptors)s)
+                    )
+                    AND
+                    colour.fg IS NOT NULL
+                    AND
+                    colour.bg IS NOT NULL
+            ),
+            (
+                SELECT COALESCE(json_agg(json_build_array(
+                    toc.name, toc.atoc, colour.fg, colour.bg
+                )), '[]')
+                FROM
+                    {toc_table} AS toc
+                INNER JOIN
+                    {colour_table} AS colour
+                ON
+                    toc.atoc = colour.code
+                WHERE
+                    (
+                        toc.atoc IN (SELECT atoc FROM operators)
+                        OR
+                        toc.atoc IN (SELECT atoc FROM brands)
+                    )
+                    AND
+                    colour.fg IS NOT NULL
+                    AND
+                    colour.bg IS NOT NULL
+            ),
+            (
+                SELECT COALESCE(json_agg(json_build_array(
+                    parent, atoc, endpoints
+                )), '[]')
+                FROM brands
+            )
+    """
+    rows = select_query(
+        cur, statement, {"descriptors": descriptors, "operators": operators}
+    )
+    (station_rows, toc_rows, brand_rows) = rows[0]
+    stations = {}
+    for row in station_rows:
+        station = make_station_slimline(row)
+        stations[station.name] = station
+        stations[station.crs] = station
+    brands: dict[str, list[Brand]] = {}
+    for row in brand_rows:
+        brands.setdefault(row[0], []).append(Brand(row[1], row[2]))
+    tocs = {}
+    for row in toc_rows:
+        toc = TocData(row[0], row[1], row[2], row[3], brands.get(row[1], []))
+        tocs[toc.name] = toc
+        tocs[toc.atoc] = toc
+    return ServiceLookups(stations, tocs, make_brand_lookups(tocs))
+
+
+def get_service_lookups(
+    cur, jsons: list[dict], known: Optional[ServiceLookups] = None
+) -> ServiceLookups:
+    descriptors: set[str] = set()
+    operators: set[str] = set()
+    for json in jsons:
+        descriptors.update(get_station_descriptors(json))
+        operators.add(json["atocName"])
+    if known is None:
+        return select_service_lookups(cur, list(descriptors), list(operators))
+    # only go to the database for anything missing from the known lookups, such
+    # as reference data added since they were loaded
+    missing_descriptors = [d for d in descriptors if d not in known.stations]
+    missing_operators = [o for o in operators if o not in known.tocs]
+    if len(missing_descriptors) == 0 and len(missing_operators) == 0:
+        return known
+    selected = select_service_lookups(cur, missing_descriptors, missing_operators)
+    return ServiceLookups(
+        ChainMap(selected.stations, known.stations),
+        ChainMap(selected.tocs, known.tocs),
+        ChainMap(selected.brands, known.brands),
+    )
+
+
+def get_endpoint_stations(
+    lookups: ServiceLookups, endpoints: list[dict]
+) -> list[TrainStationDataSlimline]:
     endpoint_stations = []
     for point in endpoints:
-        station = select_train_station(cur, point["description"])
+        station = lookups.stations.get(point["description"])
         if station is not None:
             endpoint_stations.append(station)
     return endpoint_stations
@@ -253,52 +544,18 @@ def format_or_none(arrow_opt: Optional[Arrow]) -> Optional[str]:
 
 
 def get_service_stops(
-    cur, locations: list[dict], run_date: Arrow
+    lookups: ServiceLookups, locations: list[dict], run_date: Arrow
 ) -> list[TrainServiceStop]:
     stops = []
-    calls = filter(lambda loc: loc["isCall"], locations)
-    call_codes = list(map(lambda call: call["crs"], calls))
-    statement = f"""
-        SELECT
-            {train_station_table}.name,
-            {train_station_table}.crs,
-            {train_station_table}.lat,
-            {train_station_table}.lon,
-            {toc_table}.name AS operator_name,
-            {toc_table}.atoc AS operator_atoc,
-            {colour_table}.fg AS operator_fg,
-            {colour_table}.bg AS operator_bg
-        FROM
-            {train_station_table}
-            INNER JOIN
-                UNNEST(%(calls)s) WITH ORDINALITY AS calls(crs, index)
-            ON
-                {train_station_table}.crs = calls.crs
-            INNER JOIN
-                {toc_table}
-            ON
-                {train_station_table}.operator = {toc_table}.atoc
-            INNER JOIN
-                {colour_table}
-            ON
-                {toc_table}.atoc = {colour_table}.code
-        ORDER BY
-            calls.index
-
-    """
-    rows = select_query(cur, statement, {"calls": call_codes})
-    for loc, row in zip(locations, rows):
+    for loc in filter(lambda loc: loc["isCall"], locations):
+        station = lookups.stations.get(loc["crs"])
+        if station is None:
+            continue
         plan_arr = get_optional_time(loc, "gbttBookedArrival", run_date)
         plan_dep = get_optional_time(loc, "gbttBookedDeparture", run_date)
         stops.append(
             TrainServiceStop(
-                TrainStationDataSlimline(
-                    row[0],
-                    row[1],
-                    row[2],
-                    row[3],
-                    TocDataSlimline(row[4], row[5], row[6], row[7]),
-                ),
+                station,
                 loc.get("platform"),
                 format_or_none(plan_arr),
                 format_or_none(plan_dep),
@@ -307,35 +564,33 @@ def get_service_stops(
     return stops
 
 
-def pull_service(
-    cur, id: str, run_date: Arrow, rtt_credentials: Credentials
-) -> Optional[TrainService]:
-    endpoint = get_train_service_api_endpoint(id, run_date)
-    json = get_json(endpoint, credentials=rtt_credentials)
-    if json is None or json.get("error") is not None:
-        return None
+def find_brand(
+    lookups: ServiceLookups,
+    operator: TocData,
+    origins: list[TrainStationDataSlimline],
+    destinations: list[TrainStationDataSlimline],
+) -> Optional[TocDataSlimline]:
+    for item in origins + destinations:
+        brand = lookups.brands.get((operator.atoc, item.name))
+        if brand is not None:
+            return brand
+    return None
+
+
+def make_service(
+    id: str, run_date: Arrow, json: dict, lookups: ServiceLookups
+) -> TrainService:
     headcode = json["trainIdentity"]
-    origins = get_endpoint_stations(cur, json["origin"])
-    destinations = get_endpoint_stations(cur, json["destination"])
-    operator_opt = select_toc(cur, json["atocName"])
+    origins = get_endpoint_stations(lookups, json["origin"])
+    destinations = get_endpoint_stations(lookups, json["destination"])
+    operator_opt = lookups.tocs.get(json["atocName"])
     if operator_opt is None:
         raise HTTPException(
             status_code=500, detail=f"Could not find toc {json['atocName']}"
         )
     operator = operator_opt
     if len(operator.brands) > 0:
-        found_brand = None
-        for brand in operator.brands:
-            endpoints = brand.endpoints
-            for item in origins:
-                if item.name in endpoints:
-                    found_brand = brand
-                    break
-            if found_brand is None:
-                for item in destinations:
-                    if item.name in endpoints:
-                        found_brand = brand
-                        break
+        found_brand = find_brand(lookups, operator, origins, destinations)
         if found_brand is None:
             origin_strings = list(map(lambda p: p.name, origins))
             destination_strings = list(map(lambda p: p.name, destinations))
@@ -343,7 +598,7 @@ def pull_service(
                 status_code=500,
                 detail=f"Cannot find brand for origins {origin_strings} or destinations {destination_strings}",
             )
-        operator_slimline = get_or_throw(select_toc(cur, brand.atoc)).to_slimline()
+        operator_slimline = found_brand
     else:
         operator_slimline = operator.to_slimline()
     first_origin_time = arrow.get(json["origin"][0]["publicTime"], "HHmm")
@@ -354,7 +609,7 @@ def pull_service(
         first_origin_time.hour,
         first_origin_time.minute,
     )
-    stops = get_service_stops(cur, json["locations"], run_date)
+    stops = get_service_stops(lookups, json["locations"], run_date)
     return TrainService(
         id,
         headcode,
@@ -364,3 +619,16 @@ def pull_service(
         stops,
         operator_slimline,
     )
+
+
+def pull_service(
+    id: str,
+    run_date: Arrow,
+    rtt_credentials: Credentials,
+    known: Optional[ServiceLookups] = None,
+) -> Optional[TrainService]:
+    json = get_service_json(id, run_date, rtt_credentials)
+    if json is None or not is_valid_service_json(json):
+        return None
+    lookups = run_with_cursor(get_service_lookups, [json], known)
+    return make_service(id, run_date, json, lookups)
@@ -1,4 +1,5 @@
-from typing import List, Optional, Tuple
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import urlencode
 from bs4 import BeautifulSoup, Tag
 from arrow import Arrow
 import arrow
@@ -54,11 +55,8 @@ def get_bus_stop_atco(stop_page: BeautifulSoup) -> str:
 bracket_regex = r"(.*) \((.*)\)"
 
 
-def get_bus_stop(atco: str) -> Optional[BusStop]:
-    json = get_json_from_api(f"bus/stop/{atco}")
-    if json is None:
-        return None
-    stop = BusStop(
+def make_bus_stop(json: dict) -> BusStop:
+    return BusStop(
         json["atco"],
         json["naptan"],
         json["name"],
@@ -71,7 +69,27 @@ def get_bus_stop(atco: str) -> Optional[BusStop]:
         json["lat"],
         json["lon"],
     )
-    return stop
+
+
+def get_bus_stop(atco: str) -> Optional[BusStop]:
+    json = get_json_from_api(f"bus/stop/{atco}")
+    if json is None:
+        return None
+    return make_bus_stop(json)
+
+
+def get_bus_stops(atcos: List[str]) -> Dict[str, BusStop]:
+    if len(atcos) == 0:
+        return {}
+    query = urlencode(list(map(lambda atco: ("atco", atco), atcos)))
+    json = get_json_from_api(f"bus/stops?{query}")
+    if json is None:
+        raise RuntimeError("Could not get bus stops")
+    stops = {}
+    for item in json:
+        stop = make_bus_stop(item)
+        stops[stop.atco] = stop
+    return stops
 
 
 def get_bus_trip_page(id: int, stop_time: Optional[int] = None) -> BeautifulSoup:
@@ -120,15 +138,15 @@ def get_time_from_trip_stop_row(date: Arrow, row: Tag, cell_index: int) -> Arrow
     return arrow.get(date.year, date.month, date.day, int(hours), int(minutes), 0)
 
 
-def get_trip_stop_details(
-    date: Arrow, arr_row: Tag, dep_row: Optional[Tag], service_page: BeautifulSoup
-) -> Optional[BusTripStop]:
+def get_trip_stop_atco(arr_row: Tag) -> str:
     link = select_one(arr_row, "a")
     href = get_href(link)
-    atco = href.split("/")[2]
-    stop = get_bus_stop(atco)
-    if stop is None:
-        return None
+    return href.split("/")[2]
+
+
+def make_trip_stop(
+    date: Arrow, stop: BusStop, arr_row: Tag, dep_row: Optional[Tag]
+) -> BusTripStop:
     arr_time = get_time_from_trip_stop_row(date, arr_row, 1)
     if dep_row is None:
         dep_time = arr_time
@@ -137,6 +155,16 @@ def get_trip_stop_details(
     return BusTripStop(stop, arr_time, dep_time)
 
 
+def get_trip_stop_details(
+    date: Arrow, arr_row: Tag, dep_row: Optional[Tag], service_page: BeautifulSoup
+) -> Optional[BusTripStop]:
+    atco = get_trip_stop_atco(arr_row)
+    stop = get_bus_stop(atco)
+    if stop is None:
+        return None
+    return make_trip_stop(date, stop, arr_row, dep_row)
+
+
 def get_trip_stop_details_at_time(
     trip_page: BeautifulSoup, date: Arrow, stop_time: int, service_page: BeautifulSoup
 ) -> Optional[BusTripStop]:
@@ -160,7 +188,7 @@ def get_all_trip_stop_details(
     date: Arrow, trip_page: BeautifulSoup, service_page: BeautifulSoup
 ) -> List[BusTripStop]:
     rows = select_all(trip_page, ".trip-timetable tbody tr")
-    stops = []
+    stop_rows = []
     current_index = 0
     while current_index < len(rows):
         arr_row = rows[current_index]
@@ -171,11 +199,16 @@ def get_all_trip_stop_details(
         else:
             dep_row = None
             current_index = current_index + 1
-        stop_details = get_trip_stop_details(date, arr_row, dep_row, service_page)
-        if stop_details is None:
+        stop_rows.append((get_trip_stop_atco(arr_row), arr_row, dep_row))
+    # look up every stop on the trip in one request rather than one per row
+    bus_stops = get_bus_stops(list(map(lambda row: row[0], stop_rows)))
+    stops = []
+    for atco, arr_row, dep_row in stop_rows:
+        stop = bus_stops.get(atco)
+        if stop is None:
             raise RuntimeError("Stop on service does not exist!")
         else:
-            stops.append(stop_details)
+            stops.append(make_trip_stop(date, stop, arr_row, dep_row))
     return stops
 
 
@@ -1,7 +1,7 @@
 import arrow
 import yaml
 from pathlib import Path
-from typing import Dict, Tuple
+from typing import Dict, Optional, Tuple
 
 from selenium import webdriver
 from selenium.webdriver.firefox.options import Options
@@ -12,8 +12,8 @@ from structs import Segment, get_segment
 
 from bus.scrapers import get_bus_trip
 
-from train.scrapers import make_train_service
-from train.structs import TrainStation
+from train.scrapers import get_location_crs, make_train_services
+from train.structs import TrainService, TrainStation
 
 from walk.scraper import get_direction_stats
 from walk.structs import WalkPoint, WalkStop, WalkTrip
@@ -51,17 +51,37 @@ def parse_bus_element(item: dict, driver) -> Segment:
     return segment
 
 
+def get_train_services(
+    items: list[dict],
+) -> Dict[Tuple[str, arrow.Arrow], Optional[TrainService]]:
+    services = [
+        (item["id"], arrow.get(item["date"]))
+        for item in items
+        if item["type"] == "train"
+    ]
+    return make_train_services(services)
+
+
+def get_train_stop_crs(trip: TrainService, code: str) -> str:
+    # board and alight are usually crs codes, but any code that corpus knows
+    # about can be used, such as a tiploc or stanox
+    if any(stop.get_identifier() == code for stop in trip.get_stops()):
+        return code
+    return get_location_crs(code)
+
+
 def parse_train_element(
     element: dict,
     driver,
+    services: Dict[Tuple[str, arrow.Arrow], Optional[TrainService]],
 ) -> Segment:
     id = element["id"]
     date = arrow.get(element["date"])
-    board = element["board"]
-    alight = element["alight"]
-    trip = make_train_service(id, date)
+    trip = services.get((id, date))
     if trip is None:
         raise RuntimeError(f"Service {id} did not run on {date}")
+    board = get_train_stop_crs(trip, str(element["board"]))
+    alight = get_train_stop_crs(trip, str(element["alight"]))
     segment = get_segment(
         trip, board, alight, trip.operator.fg_colour, trip.operator.bg_colour
     )
@@ -95,11 +115,13 @@ def parse_elements(items: list[dict]) -> list[Segment]:
     options = Options()
     options.headless = True
     driver = webdriver.Firefox(options=options)
+    # fetch every train leg up front in a single request to the api
+    train_services = get_train_services(items)
     segments = []
     for item in items:
         segment = None
         if item["type"] == "train":
-            segment = parse_train_element(item, driver)
+            segment = parse_train_element(item, driver, train_services)
         elif item["type"] == "bus":
             segment = parse_bus_element(item, driver)
         if segment is not None:
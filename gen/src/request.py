@@ -1,8 +1,13 @@
 from json import JSONDecodeError
 from dotenv import dotenv_values
+import hashlib
+import json
+import os
 import requests
+import time
 
-from typing import Optional, TypeVar
+from pathlib import Path
+from typing import Any, Optional, TypeVar
 from bs4 import BeautifulSoup, ResultSet, Tag
 from requests import Response
 from requests.auth import HTTPBasicAuth
@@ -32,26 +37,99 @@ def make_request(
     return requests.get(url, auth=auth, stream=stream, headers=headers)
 
 
+env_variables = dotenv_values()
+api_host = env_variables["API_HOST"]
+
+# Responses that come with an ETag or a max-age are kept on disk between runs.
+# Fresh ones are used without asking the server again, and stale ones are
+# revalidated with If-None-Match so that an unchanged body is not sent again.
+cache_directory = Path(env_variables.get("CACHE_DIR") or ".cache")
+
+
+def get_cache_path(url: str) -> Path:
+    return cache_directory / f"{hashlib.sha256(url.encode()).hexdigest()}.json"
+
+
+def read_cache_entry(url: str) -> Optional[dict]:
+    path = get_cache_path(url)
+    if not os.path.exists(path):
+        return None
+    try:
+        with open(path, "r") as f:
+            return json.load(f)
+    except (OSError, JSONDecodeError):
+        return None
+
+
+def get_max_age(response: Response) -> Optional[int]:
+    cache_control = response.headers.get("Cache-Control")
+    if cache_control is None:
+        return None
+    for directive in cache_control.split(","):
+        directive = directive.strip()
+        if directive.startswith("max-age="):
+            try:
+                return int(directive[len("max-age=") :])
+            except ValueError:
+                return None
+    return None
+
+
+def write_cache_entry(url: str, response: Response, body: Any, etag: Optional[str]):
+    if "no-store" in response.headers.get("Cache-Control", ""):
+        return
+    max_age = get_max_age(response)
+    if etag is None and max_age is None:
+        return
+    expires = None if max_age is None else time.time() + max_age
+    entry = {"etag": etag, "expires": expires, "body": body}
+    if not os.path.exists(cache_directory):
+        os.makedirs(cache_directory)
+    with open(get_cache_path(url), "w") as f:
+        json.dump(entry, f)
+
+
 def get_json(
     url: str, credentials: Optional[Credentials] = None, headers: Optional[dict] = None
-) -> Optional[dict]:
-    response = make_request(url, credentials=credentials)
+) -> Optional[Any]:
+    entry = read_cache_entry(url)
+    if entry is not None and entry["expires"] is not None:
+        if entry["expires"] > time.time():
+            return entry["body"]
+    request_headers = dict(headers or {})
+    if entry is not None and entry["etag"] is not None:
+        request_headers["If-None-Match"] = entry["etag"]
+    response = make_request(url, credentials=credentials, headers=request_headers)
+    if response.status_code == 304 and entry is not None:
+        write_cache_entry(url, response, entry["body"], entry["etag"])
+        return entry["body"]
     if response.status_code == 200:
         try:
-            return response.json()
+            body = response.json()
         except JSONDecodeError:
             return None
+        write_cache_entry(url, response, body, response.headers.get("ETag"))
+        return body
     else:
         return None
 
 
-env_variables = dotenv_values()
-api_host = env_variables["API_HOST"]
+def get_json_from_api(endpoint: str) -> Optional[Any]:
+    url = f"{api_host}/{endpoint}"
+    return get_json(url)
 
 
-def get_json_from_api(endpoint: str) -> Optional[dict]:
+def post_json_to_api(endpoint: str, data: list | dict) -> Optional[list | dict]:
     url = f"{api_host}/{endpoint}"
-    return get_json(url)
+    print(f"Making post request to {url}")
+    response = requests.post(url, json=data)
+    if response.status_code == 200:
+        try:
+            return response.json()
+        except JSONDecodeError:
+            return None
+    else:
+        return None
 
 
 def get_page(url: str, credentials: Optional[Credentials] = None) -> BeautifulSoup:
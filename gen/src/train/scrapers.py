@@ -1,10 +1,16 @@
-from typing import Dict, List, Optional
+from typing import Dict, List, Optional, Tuple
 from arrow import Arrow
 import arrow
 from bs4 import BeautifulSoup
 from credentials import Credentials
 
-from request import get_json, get_json_from_api, get_or_throw, get_page
+from request import (
+    get_json,
+    get_json_from_api,
+    get_or_throw,
+    get_page,
+    post_json_to_api,
+)
 
 from train.structs import Toc, TrainService, TrainServiceStop, TrainStation, TrainStop
 from train.urls import get_train_service_url
@@ -22,6 +28,16 @@ def get_train_service_json(
     return get_json(json_url, credentials=credentials)
 
 
+def get_location_crs(code: str) -> str:
+    locations = get_json_from_api(f"train/location/{code}")
+    if locations is None:
+        raise RuntimeError(f"Location with code {code} not found")
+    for location in locations:
+        if location["crs"] is not None:
+            return location["crs"]
+    raise RuntimeError(f"Location with code {code} is not a station")
+
+
 def get_train_service_page(id: str, date: Arrow) -> BeautifulSoup:
     page_url = get_train_service_url(id, date)
     return get_page(page_url)
@@ -78,6 +94,38 @@ def make_train_service(id: str, date: Arrow) -> Optional[TrainService]:
     )
     if service_json is None:
         return None
+    return make_train_service_from_json(id, service_json)
+
+
+def make_train_services(
+    services: List[Tuple[str, Arrow]]
+) -> Dict[Tuple[str, Arrow], Optional[TrainService]]:
+    if len(services) == 0:
+        return {}
+    request = list(
+        map(
+            lambda service: {
+                "id": service[0],
+                "date": service[1].format("YYYY-MM-DD"),
+            },
+            services,
+        )
+    )
+    results = post_json_to_api("train/services", request)
+    if results is None:
+        raise RuntimeError("Could not get train services")
+    train_services: Dict[Tuple[str, Arrow], Optional[TrainService]] = {}
+    for service, result in zip(services, results):
+        if result["service"] is None:
+            train_services[service] = None
+        else:
+            train_services[service] = make_train_service_from_json(
+                service[0], result["service"]
+            )
+    return train_services
+
+
+def make_train_service_from_json(id: str, service_json: dict) -> TrainService:
     origins = list(
         map(
             lambda ep: TrainStation(